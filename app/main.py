@@ -1,18 +1,105 @@
+import io
+import json as pyjson
 import os
 import sys
-import fitz  # PyMuPDF
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 import streamlit as st
 
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to Pydantic's serializer
+    orjson = None
+
 # Add parent directory to path to import from services
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from services import extractor, api
+from services import extractor, api, llm_cache
 from services.api import handle_api_error
 from services.transformer import parse_tables_from_csv
 from examples.init import load_examples
 from prompts.schema import OutputModel
 from utils.chunk import chunk_text
 
+_CONTEXT_MODEL_NAME = "gemini-2.5-pro-preview-06-05"
+# Characters of the first page sent to the context/relationship suggestion prompts
+_CTX_SNIPPET_CHARS = 8000
+
+
+def _truncate_at_word(text: str, max_chars: int) -> str:
+    """Cut text to at most max_chars, backing up to the last whitespace so no word is split."""
+    if len(text) <= max_chars:
+        return text
+    cut = max(text.rfind(" ", 0, max_chars + 1), text.rfind("\n", 0, max_chars + 1))
+    return text[:cut] if cut > 0 else text[:max_chars]
+
+
+def _prompt_digest(model_name: str, prompt: list[str], temperature: float) -> str:
+    """SHA-256 over the model, prompt parts and temperature, used as an explicit cache key."""
+    return hashlib.sha256((model_name + "".join(prompt) + str(temperature)).encode("utf-8")).hexdigest()
+
+
+def _api_key_fingerprint(api_key: str) -> str:
+    """Short SHA-256 of an API key, used to key caches without storing the key itself."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+@st.cache_resource(show_spinner=False)
+def _get_model(model_name: str, api_key_fingerprint: str):
+    """
+    Share one GenerativeModel per (model name, API key) across reruns and sessions.
+    A model binds its client on first use, so a new key needs a new model instance.
+    """
+    return api.genai.GenerativeModel(model_name=model_name)
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_generate(model_name: str, api_key_fingerprint: str, prompt_hash: str, _prompt: list[str], temperature: float, max_output_tokens: int) -> str:
+    """Call Gemini once per prompt_hash; the prompt itself is excluded from Streamlit's hashing."""
+    model = _get_model(model_name, api_key_fingerprint)
+    gen_conf = api.genai.types.GenerationConfig(max_output_tokens=max_output_tokens, temperature=temperature)
+    return model.generate_content(_prompt, generation_config=gen_conf).text
+
+
+@st.cache_data(show_spinner=False)
+def _extract_cached(pdf_hash: str, _pdf_bytes: bytes | memoryview, method: str) -> list[str]:
+    """Extract PDF tables once per (content hash, method) across reruns and sessions; the bytes are not hashed again."""
+    return extractor.extract_tables_from_pdf(_pdf_bytes, method=method)
+
+
+@st.cache_data(show_spinner=False)
+def _pdf_text_cached(pdf_hash: str, _pdf_bytes: bytes) -> str:
+    """Extract the raw text of a PDF once per content hash; the bytes are not hashed again."""
+    return "\n".join(extractor.extract_text_from_pdf(_pdf_bytes))
+
+
+@st.cache_data(show_spinner=False)
+def _context_text_cached(file_hash: str, _payload: bytes, file_name: str) -> str:
+    """Read an additional context file (PDF or text) once per content hash; the bytes are not hashed again."""
+    if file_name.lower().endswith(".pdf"):
+        return _pdf_text_cached(file_hash, _payload)
+    return _payload.decode("utf-8")
+
+
+@st.cache_data(show_spinner=False)
+def _parse_example_csv(payload: bytes) -> tuple[list, list]:
+    """Return the headers and first row of an example CSV, cached on its bytes."""
+    df = pd.read_csv(io.BytesIO(payload), nrows=1)
+    return list(df.columns), (df.iloc[0].tolist() if not df.empty else [])
+
+
+def _frame_digest(df: pd.DataFrame) -> str:
+    """Content key for a DataFrame: column names plus an order-sensitive digest of its row hashes."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values.tobytes() if not df.empty else b""
+    return f"{list(df.columns)}:{df.shape}:{hashlib.sha256(row_hashes).hexdigest()}"
+
+
+@st.cache_data(show_spinner=False)
+def _encode_csv(df_hash: str, _df: pd.DataFrame) -> bytes:
+    """Encode a table for download once per content hash instead of on every rerun."""
+    return _df.to_csv(index=False).encode('utf-8')
+
 # Page configuration
 st.set_page_config(page_title="PDF ➜ Relational CSVs (Gemini)", layout="wide")
 st.title("📄 PDF Tables → Relational CSVs (Gemini-powered)")
@@ -50,6 +137,22 @@ table_method = st.sidebar.selectbox(
     help="Choose the strategy for table extraction from PDF."
 )
 
+with st.sidebar.expander("API settings"):
+    rpm_limit = st.number_input(
+        "Requests per minute", min_value=1, max_value=10_000,
+        value=api.DEFAULT_REQUESTS_PER_MINUTE, step=1,
+        help="Requests are paced client-side to stay within your Gemini quota."
+    )
+    tpm_limit = st.number_input(
+        "Input tokens per minute", min_value=1_000, max_value=100_000_000,
+        value=api.DEFAULT_TOKENS_PER_MINUTE, step=10_000
+    )
+    use_response_cache = st.checkbox(
+        "Reuse cached Gemini responses", value=llm_cache.is_enabled(),
+        help="Deterministic extraction and CSV responses are stored on disk; untick to always query Gemini."
+    )
+api.configure_rate_limits(rpm_limit, tpm_limit)
+
 num_tables = st.sidebar.number_input(
     "Number of CSV tables to generate",
     min_value=1, max_value=5, value=1, step=1
@@ -96,7 +199,7 @@ if uploaded_pdf is not None:
         keys_to_clear = [
             'pages_text', 'additional_context_text', 'suggestions_just_generated',
             'suggested_context', 'suggested_relationships', 'csv_tables_generated',
-            'generated_json_data'
+            'generated_json_data', 'generated_json_dict'
         ]
         for key in keys_to_clear:
             if key in st.session_state:
@@ -110,14 +213,30 @@ if uploaded_pdf is not None:
     if 'pages_text' not in st.session_state:
         try:
             with st.spinner("Extracting tables from PDF..."):
-                pdf_bytes = uploaded_pdf.getvalue()
-                st.session_state.pages_text = extractor.extract_tables_from_pdf(pdf_bytes, method=table_method)
+                # getbuffer() is a zero-copy view over the upload; getvalue() would copy it
+                pdf_bytes = uploaded_pdf.getbuffer()
+                pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+                st.session_state.pages_text = _extract_cached(pdf_hash, pdf_bytes, table_method)
             st.success(f"Extracted content from {len(st.session_state.pages_text)} page(s).")
         except Exception as e:
             st.error(f"Failed to read PDF: {e}")
             st.stop()
     pages_text = st.session_state.pages_text
 
+    # Read the additional context file if provided
+    if 'additional_context_text' not in st.session_state:
+        st.session_state.additional_context_text = ""
+        if additional_context_file is not None:
+            try:
+                context_bytes = additional_context_file.getvalue()
+                context_hash = hashlib.sha256(context_bytes).hexdigest()
+                st.session_state.additional_context_text = _context_text_cached(
+                    context_hash, context_bytes, additional_context_file.name
+                )
+            except (RuntimeError, UnicodeDecodeError) as e:  # unreadable PDF (PyMuPDF's FileDataError) or non-UTF-8 text
+                st.sidebar.warning(f"Could not read the additional context file: {e}")
+    additional_context_text = st.session_state.additional_context_text
+
     # Determine built-in examples usage if no user example provided
     built_in_examples = []
     n_examples = 0
@@ -135,8 +254,9 @@ if uploaded_pdf is not None:
     example_pdf_text = ""
     if example_pdf_file is not None:
         try:
-            with fitz.open(stream=example_pdf_file.read(), filetype="pdf") as doc:
-                example_pdf_text = "\n".join(page.get_text() for page in doc)
+            example_pdf_bytes = example_pdf_file.getvalue()
+            example_pdf_hash = hashlib.sha256(example_pdf_bytes).hexdigest()
+            example_pdf_text = _pdf_text_cached(example_pdf_hash, example_pdf_bytes)
         except Exception as e:
             st.sidebar.error(f"Failed to read example PDF: {e}")
     example_json_text = ""
@@ -150,15 +270,21 @@ if uploaded_pdf is not None:
     if pages_text and not st.session_state.get('suggestions_just_generated'):
         with st.spinner("Analyzing tables with Gemini to generate context (runs once)..."):
             try:
-                model_context = api.genai.GenerativeModel(model_name="gemini-2.5-pro-preview-06-05")
-                gen_conf = api.genai.types.GenerationConfig(max_output_tokens=4096, temperature=0.3)
-                first_page_snippet = pages_text[0][:8000] if pages_text else ""
-                ctx_prompt = f"Based on the following extracted table data, write a detailed prompt describing the overall context, data types, and business rules.\n\n{first_page_snippet}"
-                rel_prompt = f"Using the same extracted table data, describe plausible primary/foreign key relationships and hierarchical links in detail.\n\n{first_page_snippet}"
-                ctx_resp = model_context.generate_content(ctx_prompt, generation_config=gen_conf)
-                rel_resp = model_context.generate_content(rel_prompt, generation_config=gen_conf)
-                st.session_state["suggested_context"] = ctx_resp.text.strip()
-                st.session_state["suggested_relationships"] = rel_resp.text.strip()
+                first_page_snippet = _truncate_at_word(pages_text[0], _CTX_SNIPPET_CHARS) if pages_text else ""
+                # Keep the shared snippet as an identical leading part so Gemini can reuse its prefix cache
+                shared_prefix = f"Extracted table data:\n{first_page_snippet}\n\n"
+                ctx_prompt = [shared_prefix, "Based on the extracted table data above, write a detailed prompt describing the overall context, data types, and business rules."]
+                rel_prompt = [shared_prefix, "Using the extracted table data above, describe plausible primary/foreign key relationships and hierarchical links in detail."]
+                # The two prompts are independent, so issue both requests concurrently
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    key_fingerprint = _api_key_fingerprint(google_api_key)
+                    f_ctx = executor.submit(_cached_generate, _CONTEXT_MODEL_NAME, key_fingerprint, _prompt_digest(_CONTEXT_MODEL_NAME, ctx_prompt, 0.3), ctx_prompt, 0.3, 4096)
+                    f_rel = executor.submit(_cached_generate, _CONTEXT_MODEL_NAME, key_fingerprint, _prompt_digest(_CONTEXT_MODEL_NAME, rel_prompt, 0.3), rel_prompt, 0.3, 4096)
+                    # A failure of either request propagates to the handler below
+                    ctx_text = f_ctx.result()
+                    rel_text = f_rel.result()
+                st.session_state["suggested_context"] = ctx_text.strip()
+                st.session_state["suggested_relationships"] = rel_text.strip()
                 st.session_state["suggestions_just_generated"] = True
                 st.rerun()
             except Exception as e:
@@ -178,11 +304,7 @@ if uploaded_pdf is not None:
     if example_csv_files:
         for i, csv_file in enumerate(example_csv_files):
             try:
-                csv_file.seek(0)
-                import pandas as pd
-                df_ex = pd.read_csv(csv_file)
-                headers = list(df_ex.columns)
-                first_row = df_ex.iloc[0].tolist() if not df_ex.empty else []
+                headers, first_row = _parse_example_csv(csv_file.getvalue())
                 table_label = table_names[i] if i < len(table_names) else f"Table{i+1}"
                 snippet = f"Example for Table '{table_label}':\nHeaders: {headers}\nFirst row: {first_row}\n"
                 example_snippets.append(snippet)
@@ -201,15 +323,17 @@ if uploaded_pdf is not None:
                 few_shot_examples = built_in_examples[:n_examples]
         # Generate JSON from PDF text
         st.session_state.generated_json_data = None
+        st.session_state.generated_json_dict = None
         st.session_state.csv_tables_generated = None
         with st.spinner("Asking Gemini to convert PDF to structured JSON..."):
             json_output_text = api.generate_structured_json(
                 pages_text=pages_text,
                 context_text=edited_context,
                 relationships_text=edited_relationships,
-                additional_context_text=additional_context_text if 'additional_context_text' in st.session_state else "",
+                additional_context_text=additional_context_text,
                 manual_context_text=user_context,
-                examples=few_shot_examples
+                examples=few_shot_examples,
+                use_cache=use_response_cache
             )
         # Validate JSON output
         try:
@@ -217,6 +341,15 @@ if uploaded_pdf is not None:
         except Exception as e:
             # Display validation errors
             errors = e.errors() if hasattr(e, 'errors') else [{"msg": str(e)}]
+            # Drop the rejected responses so the next attempt asks Gemini again instead of replaying them
+            api.forget_structured_json(
+                pages_text=pages_text,
+                context_text=edited_context,
+                relationships_text=edited_relationships,
+                additional_context_text=additional_context_text,
+                manual_context_text=user_context,
+                examples=few_shot_examples
+            )
             st.error("JSON validation failed. Please review the output and context.")
             for err in errors:
                 loc = err.get('loc', None)
@@ -228,18 +361,23 @@ if uploaded_pdf is not None:
             st.stop()
         else:
             # Reformat JSON for consistent indentation
+            json_dict = parsed_model.model_dump(mode="json", exclude_none=True)
             try:
-                json_pretty = parsed_model.model_dump_json(indent=2, exclude_none=True)
+                if orjson is not None:
+                    json_pretty = orjson.dumps(json_dict, option=orjson.OPT_INDENT_2).decode()
+                else:
+                    json_pretty = parsed_model.model_dump_json(indent=2, exclude_none=True)
             except Exception:
-                import json as pyjson
                 json_pretty = pyjson.dumps(parsed_model.model_dump(), indent=2)
             st.session_state.generated_json_data = json_pretty
+            # Keep the dict form for display so st.json does not re-parse the string on every rerun
+            st.session_state.generated_json_dict = json_dict
             st.success("Successfully generated structured JSON from PDF text.")
 
     # After JSON generation, proceed to CSV generation
     if 'generated_json_data' in st.session_state and st.session_state.generated_json_data:
         st.subheader("View Generated JSON")
-        st.json(st.session_state.generated_json_data)
+        st.json(st.session_state.get("generated_json_dict") or st.session_state.generated_json_data, expanded=False)
         
         # Only generate CSV tables if not already generated
         if 'csv_tables_generated' not in st.session_state or not st.session_state.csv_tables_generated:
@@ -250,9 +388,10 @@ if uploaded_pdf is not None:
                         table_names=table_names,
                         context_text=edited_context,
                         relationships_text=edited_relationships,
-                        additional_context_text=additional_context_text if 'additional_context_text' in st.session_state else "",
+                        additional_context_text=additional_context_text,
                         manual_context_text=user_context,
-                        example_snippets=example_snippets
+                        example_snippets=example_snippets,
+                        use_cache=use_response_cache
                     )
                 except Exception as e:
                     handle_api_error(e, "CSV generation")
@@ -277,7 +416,7 @@ if uploaded_pdf is not None:
                     st.markdown(f"#### {table_name}")
                     df_to_display = generated_tables[table_name]
                     st.dataframe(df_to_display)
-                    csv_buffer = df_to_display.to_csv(index=False).encode('utf-8')
+                    csv_buffer = _encode_csv(_frame_digest(df_to_display), df_to_display)
                     st.download_button(
                         label=f"Download {table_name}.csv",
                         data=csv_buffer,
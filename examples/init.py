@@ -2,20 +2,39 @@
 Few-shot example loader for JSON output examples.
 Scans the package directory for example JSON and corresponding PDFs.
 """
+import functools
+import os
 from pathlib import Path
 from typing import List, Tuple
+from services.extractor import extract_text_from_pdf
 
 def load_examples(max_examples: int = None) -> List[Tuple[str, str]]:
     """
     Load example PDF/JSON pairs from the examples directory.
     Expects JSON files and matching PDF files with the same base name.
     
+    Results are cached per directory modification time, so repeated calls (e.g. on every
+    Streamlit rerun) skip re-parsing the PDFs until files are added, removed or renamed.
+    
     :param max_examples: If given, limit the number of examples returned.
     :return: List of (example_pdf_text, example_json_text) tuples.
     """
     examples_dir = Path(__file__).parent
+    try:
+        dir_mtime_ns = os.stat(examples_dir).st_mtime_ns
+    except OSError:
+        return []
+    return list(_load_examples_cached(str(examples_dir), dir_mtime_ns, max_examples))
+
+@functools.lru_cache(maxsize=8)
+def _load_examples_cached(
+    examples_dir: str, dir_mtime_ns: int, max_examples: int | None
+) -> tuple[tuple[str, str], ...]:
+    """
+    Scan examples_dir for JSON/PDF pairs; dir_mtime_ns is only part of the cache key.
+    """
     example_pairs: List[Tuple[str, str]] = []
-    json_files = sorted(examples_dir.glob("*.json"))
+    json_files = sorted(Path(examples_dir).glob("*.json"))
     for json_file in json_files:
         if max_examples is not None and len(example_pairs) >= max_examples:
             break
@@ -28,11 +47,10 @@ def load_examples(max_examples: int = None) -> List[Tuple[str, str]]:
             continue
         example_pdf_text = ""
         try:
-            import fitz
-            with fitz.open(stream=pdf_file.read_bytes(), filetype="pdf") as doc:
-                example_pdf_text = "\n".join(page.get_text() for page in doc)
+            # Pass the path so MuPDF reads the file directly without an intermediate bytes copy
+            example_pdf_text = "\n".join(extract_text_from_pdf(str(pdf_file)))
         except Exception:
             example_pdf_text = ""
         if example_pdf_text.strip() and example_json_text.strip():
             example_pairs.append((example_pdf_text, example_json_text))
-    return example_pairs
\ No newline at end of file
+    return tuple(example_pairs)
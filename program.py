@@ -1,14 +1,63 @@
 import os
 import re
+import bisect
+import hashlib
+import contextlib
+from collections import Counter
+import itertools
 import io
 import fitz  # PyMuPDF
 import pandas as pd
 import streamlit as st
 import google.generativeai as genai
-from io import BytesIO, StringIO
+from google.api_core.exceptions import GoogleAPIError
+from google.auth.exceptions import GoogleAuthError
+from io import StringIO
 import csv
+import datetime
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor
+from services.api import wait_for_quota
+# Page-range extraction runs in worker processes, so the worker must live in an importable module
+from services.extractor import extract_text_from_pdf
+from services.transformer import deep_merge
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the standard library
+    orjson = None
+
+GEMINI_MODEL_NAME = 'gemini-2.5-pro-preview-06-05'
+
+# Characters of the first page sent to the suggestion prompt
+CONTEXT_SNIPPET_CHARS = 8000
+
+# Number of summaries merged per consolidation request when reducing large context files
+SUMMARY_FAN_IN = 4
+
+# Upper bound on simultaneous Gemini requests to stay within provider rate limits
+MAX_CONCURRENT_REQUESTS = 4
+
+# Worker processes for per-page PDF text extraction
+PDF_EXTRACT_WORKERS = min(os.cpu_count() or 1, 4)
+
+# ------------------------------------------------------------
+# Helper: JSON (de)serialization, using orjson when it is installed
+# ------------------------------------------------------------
+def json_loads(text: str):
+    """
+    Parse JSON text; orjson's decode error subclasses json.JSONDecodeError, so callers catch that.
+    """
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def json_dumps_pretty(data) -> str:
+    """
+    Serialize data as JSON indented by two spaces.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(data, indent=2)
 
 # ------------------------------------------------------------
 # Helper: an improved error handler for API calls
@@ -30,42 +79,248 @@ def handle_api_error(e, step_name="API call"):
     st.stop()
 
 
+# ------------------------------------------------------------
+# Helper: content-addressed cache for Gemini responses
+# ------------------------------------------------------------
+def prompt_digest(model_name: str, prompt: str, temperature: float | None = None) -> str:
+    """
+    SHA-256 over the model, prompt and temperature; used as the explicit cache key.
+    """
+    return hashlib.sha256((model_name + prompt + str(temperature)).encode("utf-8")).hexdigest()
+
+
+# Generation options of the per-chunk JSON and the CSV requests; shared by the calls and by
+# forget_generated, since Streamlit keys entries on the exact arguments passed
+JSON_GENERATION_OPTIONS = {"temperature": 0.1, "response_mime_type": "application/json"}
+CSV_GENERATION_OPTIONS = {"temperature": 0.0}
+
+
+def api_key_digest(api_key: str) -> str:
+    """
+    Short SHA-256 fingerprint of an API key, so cached results are never shared between keys.
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_generate(
+    model_name: str,
+    api_key_fingerprint: str,
+    prompt_hash: str,
+    _prompt: str,
+    temperature: float | None = None,
+    max_output_tokens: int | None = None,
+    response_mime_type: str | None = None,
+) -> str:
+    """
+    Call Gemini and return the response text, reusing the stored text for identical requests.
+    The prompt itself is not hashed by Streamlit (leading underscore); prompt_hash is the key,
+    and api_key_fingerprint keeps entries from being shared between different API keys.
+    """
+    config_kwargs = {"temperature": temperature, "max_output_tokens": max_output_tokens, "response_mime_type": response_mime_type}
+    generation_config = genai.types.GenerationConfig(**{k: v for k, v in config_kwargs.items() if v is not None})
+    model = genai.GenerativeModel(model_name=model_name)
+    # Only cache misses reach the API, so only they take from the shared rate limit
+    wait_for_quota(_prompt)
+    return model.generate_content(_prompt, generation_config=generation_config).text
+
+
+def forget_generated(model_name: str, api_key_fingerprint: str, prompt_hash: str, **options) -> None:
+    """
+    Evict one cached_generate entry, e.g. a reply that failed to decode, so the next run asks Gemini again.
+    options must be the keyword arguments the entry was generated with.
+    """
+    cached_generate.clear(model_name, api_key_fingerprint, prompt_hash, None, **options)
+
+
+def generate_from_cached_content(model, prompt: str) -> str:
+    """
+    Send prompt to a model built on explicit cached content, paced by the shared rate limit like cached_generate.
+    """
+    wait_for_quota(prompt)
+    return model.generate_content(prompt).text
+
+
+# ------------------------------------------------------------
+# Helper: explicit Gemini context caching for a shared prompt preamble
+# ------------------------------------------------------------
+# Gemini rejects explicit caches below a minimum size; smaller preambles rely on implicit prefix caching
+CONTEXT_CACHE_MIN_TOKENS = 4096
+
+# Failures of the context-cache endpoints (API, quota or credential errors) that are not fatal to a run
+CONTEXT_CACHE_ERRORS = (GoogleAPIError, GoogleAuthError)
+
+def create_context_cache(preamble: str, ttl_minutes: int = 10):
+    """
+    Upload preamble once as cached content for follow-up requests.
+    Returns None when the preamble is too small to cache or the cache cannot be created.
+    """
+    # Rough estimate of ~4 characters per token avoids an extra count_tokens round-trip
+    if len(preamble) // 4 < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    try:
+        return genai.caching.CachedContent.create(
+            model=GEMINI_MODEL_NAME,
+            contents=[preamble],
+            ttl=datetime.timedelta(minutes=ttl_minutes),
+        )
+    except CONTEXT_CACHE_ERRORS:
+        return None
+
+
+# ------------------------------------------------------------
+# Helper: cached PDF extraction and context suggestions
+# ------------------------------------------------------------
+@st.cache_data(show_spinner=False)
+def extract_pages(pdf_hash: str, _pdf_bytes: bytes | memoryview) -> list[str]:
+    """
+    Per-page text of a PDF, extracted once per content hash (the bytes themselves are not hashed again).
+    """
+    return extract_text_from_pdf(_pdf_bytes, max_workers=PDF_EXTRACT_WORKERS)
+
+
+@st.cache_data(show_spinner=False, persist="disk")
+def generate_suggestions(first_page_text: str, api_key_fingerprint: str) -> tuple[str, str]:
+    """
+    Ask Gemini for the context and relationship suggestions for a first page of table data.
+    Persisted to disk so re-uploads and new sessions skip the Gemini call; the key fingerprint
+    keeps results from being shared between different API keys.
+    """
+    # One request returns both suggestions as JSON, halving the round-trips for this step
+    suggestions_prompt = (
+        "Based on the following extracted table data, return a JSON object with exactly two string keys:\n"
+        "\"context\": a detailed instructional prompt describing the overall context, data types, and business rules so another model can use it. Be thorough.\n"
+        "\"relationships\": a detailed description of the plausible PK/FK relationships, hierarchical links, and relational schema that would help build a relational dataset. Be thorough.\n\n"
+        f"{first_page_text}"
+    )
+    # Called uncached: this function's own cache only stores a reply once it has parsed, so a
+    # malformed reply raises and the next attempt asks Gemini again
+    generation_config = genai.types.GenerationConfig(temperature=0.3, max_output_tokens=8192, response_mime_type="application/json")
+    model = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME)
+    response_text = model.generate_content(suggestions_prompt, generation_config=generation_config).text
+    try:
+        parsed = json_loads(response_text)
+        return str(parsed["context"]).strip(), str(parsed["relationships"]).strip()
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"Unexpected format for context suggestions: {e}") from e
+
+
+@st.cache_data(show_spinner=False)
+def summarize_context(text_hash: str, _text: str, model_name: str, api_key_fingerprint: str) -> str:
+    """
+    Summarize a large context document chunk by chunk, then consolidate the summaries
+    level by level until at most SUMMARY_FAN_IN remain for the final consolidation.
+    Cached on the text's SHA-256 (the text itself is not hashed by Streamlit), so reruns
+    and re-uploads of the same file skip every summarization request.
+    """
+    context_chunks = chunk_text(_text)
+    if not context_chunks:
+        return ""
+    model_summarizer = genai.GenerativeModel(model_name=model_name)
+    summary_prompts = [
+        f"Summarize the key information, rules, and syntax from this piece of technical documentation:\n\n{chunk}"
+        for chunk in context_chunks
+    ]
+    consolidate_prefix = "Consolidate the following summaries into a single, coherent set of instructions and context:\n\n"
+
+    def summarize(prompt: str) -> str:
+        # The shared token bucket paces every request instead of a fixed sleep between them
+        wait_for_quota(prompt)
+        return model_summarizer.generate_content(prompt).text
+
+    # Summaries are independent, so they run concurrently within the rate limit
+    with ThreadPoolExecutor(max_workers=max(1, min(len(summary_prompts), MAX_CONCURRENT_REQUESTS))) as executor:
+        futures = [executor.submit(summarize, prompt) for prompt in summary_prompts]
+        summaries = []
+        for i, future in enumerate(futures):
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                raise RuntimeError(f"Summarization of context chunk {i+1} failed: {e}") from e
+
+        # Reduce in a SUMMARY_FAN_IN-ary tree so no consolidation prompt grows with the document size
+        level = 1
+        while len(summaries) > SUMMARY_FAN_IN:
+            groups = [summaries[i:i + SUMMARY_FAN_IN] for i in range(0, len(summaries), SUMMARY_FAN_IN)]
+            futures = [executor.submit(summarize, consolidate_prefix + "\n---\n".join(group)) for group in groups]
+            try:
+                summaries = [future.result() for future in futures]
+            except Exception as e:
+                raise RuntimeError(f"Context summary consolidation (level {level}) failed: {e}") from e
+            level += 1
+
+    final_summary_prompt = consolidate_prefix + "\n---\n".join(summaries)
+    try:
+        return summarize(final_summary_prompt)
+    except Exception as e:
+        raise RuntimeError(f"Final context summarization failed: {e}") from e
+
+
 # ------------------------------------------------------------
 # Helper: chunk long text so each piece stays within model limits
 # ------------------------------------------------------------
+_NEWLINE_RE = re.compile("\n")
+
 def chunk_text(text: str, max_chars: int = 12000) -> list[str]:
     """
     Split text into chunks whose length does not exceed max_chars,
     attempting to break at whitespace for cleaner splits.
+    Walks the text by index in a single pass, slicing only when a chunk is emitted.
+    Newline offsets are collected once up front and looked up per chunk with bisect.
     """
     chunks = []
-    current_pos = 0
-    while current_pos < len(text):
-        end_pos = current_pos + max_chars
-        if end_pos >= len(text):
-            chunk_to_add = text[current_pos:].strip()
-            if chunk_to_add:
-                 chunks.append(chunk_to_add)
-            break
-        
-        split_idx = text.rfind("\n", current_pos, end_pos)
-        if split_idx == -1 or split_idx < current_pos:
-            split_idx = text.rfind(" ", current_pos, end_pos)
-        
-        if split_idx == -1 or split_idx < current_pos:
-            split_idx = end_pos -1
-        
-        if split_idx < current_pos :
-             split_idx = end_pos -1
-             if split_idx < current_pos:
-                 split_idx = len(text) -1
-
-        chunk_to_add = text[current_pos : split_idx + 1].strip()
+    n = len(text)
+    newlines = [m.start() for m in _NEWLINE_RE.finditer(text)]
+    i = 0
+    while i < n and text[i].isspace():
+        i += 1
+    while n - i > max_chars:
+        k = bisect.bisect_left(newlines, i + max_chars) - 1
+        j = newlines[k] if k >= 0 else -1
+        if j <= i:
+            j = text.rfind(" ", i, i + max_chars)
+        if j <= i:
+            j = i + max_chars
+        chunk_to_add = text[i:j].strip()
         if chunk_to_add:
             chunks.append(chunk_to_add)
-        current_pos = split_idx + 1
-        
-    return [chunk for chunk in chunks if chunk]
+        i = j
+        while i < n and text[i].isspace():
+            i += 1
+    if i < n:
+        chunk_to_add = text[i:].strip()
+        if chunk_to_add:
+            chunks.append(chunk_to_add)
+    return chunks
+
+
+def pack_pages(pages: list[str], max_chars: int = 12000) -> list[str]:
+    """
+    Greedily pack whole pages into chunks of at most max_chars, without first joining
+    the entire document into one string. Pages longer than max_chars are split with chunk_text.
+    """
+    chunks = []
+    buf = []
+    size = 0
+    for page in pages:
+        page = page.strip()
+        if not page:
+            continue
+        if len(page) > max_chars:
+            if buf:
+                chunks.append("\n".join(buf))
+                buf, size = [], 0
+            chunks.extend(chunk_text(page, max_chars))
+            continue
+        if buf and size + len(page) + 1 > max_chars:
+            chunks.append("\n".join(buf))
+            buf, size = [page], len(page)
+        else:
+            buf.append(page)
+            size += len(page) + (1 if len(buf) > 1 else 0)
+    if buf:
+        chunks.append("\n".join(buf))
+    return chunks
 
 
 # ------------------------------------------------------------
@@ -76,8 +331,12 @@ def robust_read_csv(csv_text: str, has_header: bool = True) -> pd.DataFrame:
         return pd.DataFrame()
 
     try:
-        df = pd.read_csv(StringIO(csv_text), header=0 if has_header else None, on_bad_lines='skip', engine='python')
-        return df
+        try:
+            return pd.read_csv(StringIO(csv_text), header=0 if has_header else None, on_bad_lines='skip', engine='c')
+        except (pd.errors.ParserError, csv.Error):
+            # The C engine rejects e.g. an unclosed quote outright; the Python engine still pads short
+            # rows and keeps the rows before it (pyarrow would silently drop both)
+            return pd.read_csv(StringIO(csv_text), header=0 if has_header else None, on_bad_lines='skip', engine='python')
     except pd.errors.EmptyDataError:
         return pd.DataFrame()
     except (pd.errors.ParserError, csv.Error) as err:
@@ -87,12 +346,18 @@ def robust_read_csv(csv_text: str, has_header: bool = True) -> pd.DataFrame:
             return pd.DataFrame()
 
         try:
-            try:
-                 dialect = csv.Sniffer().sniff(lines[0] if len(lines)>0 else csv_text, delimiters=',;\t|')
-                 reader = csv.reader(lines, dialect=dialect)
-            except csv.Error:
-                 reader = csv.reader(lines)
-            all_rows = list(reader)
+            # The model is asked for comma-separated output, so try the default dialect first and
+            # only pay for Sniffer when more than 20% of rows disagree with the modal width
+            all_rows = list(csv.reader(lines))
+            widths = Counter(len(r) for r in all_rows if r)
+            if widths:
+                modal_count = widths.most_common(1)[0][1]
+                if sum(widths.values()) - modal_count > 0.2 * sum(widths.values()):
+                    try:
+                        dialect = csv.Sniffer().sniff("\n".join(lines[:20]), delimiters=',;\t|')
+                        all_rows = list(csv.reader(lines, dialect=dialect))
+                    except csv.Error:
+                        pass
         except Exception as reader_err:
             st.warning(f"CSV reader failed during fallback: {reader_err}")
             return pd.DataFrame()
@@ -125,18 +390,17 @@ def robust_read_csv(csv_text: str, has_header: bool = True) -> pd.DataFrame:
         elif col_cnt == 0 and not data_rows_data:
             return pd.DataFrame(columns=header_row_data)
 
-        fixed_rows = []
-        for r in data_rows_data:
-            if not r: continue
-            if len(r) == col_cnt: fixed_rows.append(r)
-            elif len(r) > col_cnt and col_cnt > 0 :
-                merged_last = ",".join(r[col_cnt-1:])
-                fixed_rows.append(r[:col_cnt-1] + [merged_last])
-            elif len(r) < col_cnt:
-                fixed_rows.append(r + [""] * (col_cnt - len(r)))
+        # Fold overflow fields into the last column, then let zip_longest pad short rows with ""
+        # while transposing into columns, instead of fixing each row up in a Python branch
+        rows = [r if len(r) <= col_cnt else r[:col_cnt-1] + [",".join(r[col_cnt-1:])] for r in data_rows_data if r]
+        columns = list(itertools.zip_longest(*rows, fillvalue=""))
+        columns += [("",) * len(rows)] * (col_cnt - len(columns))
 
         try:
-            if fixed_rows: return pd.DataFrame(fixed_rows, columns=header_row_data)
+            if rows:
+                df = pd.DataFrame(dict(enumerate(columns)))
+                df.columns = header_row_data
+                return df
             elif header_row_data: return pd.DataFrame(columns=header_row_data)
             else: return pd.DataFrame()
         except Exception as final_err:
@@ -146,6 +410,30 @@ def robust_read_csv(csv_text: str, has_header: bool = True) -> pd.DataFrame:
         st.error(f"Robust CSV reading failed with unexpected error: {e}. CSV Text: {csv_text[:200]}")
         return pd.DataFrame()
 
+# ------------------------------------------------------------
+# Helper: split the model's CSV response into its delimited tables
+# ------------------------------------------------------------
+_TABLE_MARKER_RE = re.compile(r"=== (START|END) OF TABLE: (.*?) ===")
+
+def split_tables(response_text: str) -> list[tuple[str, str]]:
+    """
+    Return (table_name, csv_text) pairs for every START/END marker pair, in a single finditer pass.
+    Unlike a pattern that requires exactly one "\n" around each body, markers may share a line
+    with other text, and leading/trailing line breaks (LF or CRLF) are stripped from every body.
+    """
+    tables = []
+    open_name = None
+    body_start = 0
+    for m in _TABLE_MARKER_RE.finditer(response_text):
+        kind, name = m.group(1), m.group(2)
+        if open_name is None:
+            if kind == "START":
+                open_name, body_start = name, m.end()
+        elif kind == "END" and name == open_name:
+            tables.append((open_name, response_text[body_start:m.start()].strip("\r\n")))
+            open_name = None
+    return tables
+
 # ------------------------------------------------------------
 # Streamlit page config
 # ------------------------------------------------------------
@@ -170,7 +458,9 @@ if api_key_input:
 elif "GOOGLE_API_KEY" in os.environ:
     google_api_key = os.environ["GOOGLE_API_KEY"]
 
+api_key_fingerprint = None
 if google_api_key:
+    api_key_fingerprint = api_key_digest(google_api_key)
     try:
         genai.configure(api_key=google_api_key)
     except Exception as e:
@@ -231,7 +521,7 @@ if uploaded_pdf is not None:
         keys_to_clear = [
             'pages_text', 'additional_context_text', 'suggestions_just_generated',
             'suggested_context', 'suggested_relationships', 'csv_tables_generated',
-            'generated_json_data'
+            'generated_json_data', 'generated_json_dict'
         ]
         for key in keys_to_clear:
             if key in st.session_state:
@@ -244,9 +534,9 @@ if uploaded_pdf is not None:
     if 'pages_text' not in st.session_state:
         try:
             with st.spinner("Extracting text from PDF..."):
-                doc = fitz.open(stream=uploaded_pdf.read(), filetype="pdf")
-                st.session_state.pages_text = [page.get_text() for page in doc]
-                doc.close()
+                # getbuffer() is a zero-copy view over the upload and, unlike read(), leaves it intact for later reruns
+                pdf_bytes = uploaded_pdf.getbuffer()
+                st.session_state.pages_text = extract_pages(hashlib.sha256(pdf_bytes).hexdigest(), pdf_bytes)
             st.success(f"PDF text extracted from {len(st.session_state.pages_text)} page(s).")
         except Exception as e:
             st.error(f"Failed to read PDF: {e}")
@@ -260,9 +550,7 @@ if uploaded_pdf is not None:
             try:
                 if additional_context_file.name.lower().endswith('.pdf'):
                     with st.spinner(f"Extracting text from context PDF: {additional_context_file.name}..."):
-                        context_pdf_stream = BytesIO(additional_context_file.getvalue())
-                        with fitz.open(stream=context_pdf_stream, filetype="pdf") as doc:
-                            context_pages = [page.get_text() for page in doc]
+                        context_pages = extract_text_from_pdf(additional_context_file.getbuffer(), max_workers=PDF_EXTRACT_WORKERS)
                         raw_context_text = "\n".join(context_pages)
                 else:
                     raw_context_text = additional_context_file.getvalue().decode("utf-8")
@@ -270,31 +558,15 @@ if uploaded_pdf is not None:
                 CONTEXT_SUMMARY_THRESHOLD = 15000
                 if len(raw_context_text) > CONTEXT_SUMMARY_THRESHOLD:
                     with st.spinner(f"Context file is large, summarizing it first..."):
-                        context_chunks = chunk_text(raw_context_text)
-                        summaries = []
-                        model_summarizer = genai.GenerativeModel(model_name='gemini-2.5-pro-preview-06-05')
-                        
-                        for i, chunk in enumerate(context_chunks):
-                            st.info(f"Summarizing context chunk {i+1}/{len(context_chunks)}...")
-                            try:
-                                prompt = f"Summarize the key information, rules, and syntax from this piece of technical documentation:\n\n{chunk}"
-                                resp = model_summarizer.generate_content(prompt)
-                                summaries.append(resp.text)
-                                time.sleep(1) 
-                            except Exception as e:
-                                handle_api_error(e, f"context summarization on chunk {i+1}")
-                        
-                        if summaries:
-                            st.info("Creating final summary of context...")
-                            try:
-                                final_summary_prompt = "Consolidate the following summaries into a single, coherent set of instructions and context:\n\n" + "\n---\n".join(summaries)
-                                final_resp = model_summarizer.generate_content(final_summary_prompt)
-                                st.session_state.additional_context_text = final_resp.text
-                                st.success("Large context file has been summarized.")
-                            except Exception as e:
-                                handle_api_error(e, "final context summarization")
-                        else:
-                            st.session_state.additional_context_text = ""
+                        context_hash = hashlib.sha256(raw_context_text.encode("utf-8")).hexdigest()
+                        try:
+                            st.session_state.additional_context_text = summarize_context(
+                                context_hash, raw_context_text, GEMINI_MODEL_NAME, api_key_fingerprint
+                            )
+                        except Exception as e:
+                            handle_api_error(e, "context summarization")
+                        if st.session_state.additional_context_text:
+                            st.success("Large context file has been summarized.")
                 else:
                     st.session_state.additional_context_text = raw_context_text
                 
@@ -309,7 +581,7 @@ if uploaded_pdf is not None:
     example_pdf_text = ""
     if example_pdf_file:
         try:
-            with fitz.open(stream=example_pdf_file.read(), filetype="pdf") as doc:
+            with fitz.open(stream=example_pdf_file.getvalue(), filetype="pdf") as doc:
                 if doc: example_pdf_text = "\n".join([page.get_text() for page in doc])
                 else: st.sidebar.warning("Example PDF is empty.")
         except Exception as e:
@@ -327,18 +599,10 @@ if uploaded_pdf is not None:
     ):
         with st.spinner("Analyzing tables with Gemini to generate context (runs once per file)..."):
             try:
-                model_context_gen = genai.GenerativeModel(model_name='gemini-2.5-pro-preview-06-05')
-                generation_config_context = genai.types.GenerationConfig(max_output_tokens=4096, temperature=0.3)
-                first_page_for_context = pages_text[0][:8000]
-                
-                ctx_prompt = f"Based on the following extracted table data, write a detailed instructional prompt describing the overall context, data types, and business rules so another model can use it. Be thorough.\n\n{first_page_for_context}"
-                ctx_resp = model_context_gen.generate_content(ctx_prompt, generation_config=generation_config_context)
-                
-                rel_prompt = f"Using the same extracted table data, describe in detail the plausible PK/FK relationships, hierarchical links, and relational schema that would help build a relational dataset. Be thorough.\n\n{first_page_for_context}"
-                rel_resp = model_context_gen.generate_content(rel_prompt, generation_config=generation_config_context)
-                
-                st.session_state["suggested_context"] = ctx_resp.text.strip()
-                st.session_state["suggested_relationships"] = rel_resp.text.strip()
+                first_page_for_context = pages_text[0][:CONTEXT_SNIPPET_CHARS]
+                ctx_text, rel_text = generate_suggestions(first_page_for_context, api_key_fingerprint)
+                st.session_state["suggested_context"] = ctx_text
+                st.session_state["suggested_relationships"] = rel_text
                 st.session_state.suggestions_just_generated = True
                 st.rerun()
             except Exception as e:
@@ -359,9 +623,16 @@ if uploaded_pdf is not None:
         for i, csv_file in enumerate(example_csv_files):
             try:
                 csv_file.seek(0)
-                df_ex = pd.read_csv(BytesIO(csv_file.getvalue()))
-                headers = list(df_ex.columns)
-                first_row = df_ex.iloc[0].tolist() if not df_ex.empty else []
+                # Only the header and first data row are needed, so read just those two rows
+                reader_stream = io.TextIOWrapper(csv_file, encoding='utf-8-sig', newline='')
+                try:
+                    reader = csv.reader(reader_stream)
+                    headers = next(reader, None)
+                    first_row = next(reader, [])
+                finally:
+                    reader_stream.detach()  # keep the uploaded file open for later reruns
+                if headers is None:
+                    raise ValueError("file is empty")
                 if i < len(table_names):
                     table_name = table_names[i]
                     snippet = f"Example for Table '{table_name}':\nHeaders: {headers}\nFirst row: {first_row}\n"
@@ -390,71 +661,105 @@ Now, apply the same logic and structure from the example to the real input below
 """
 # --- PART 1: Place this entire section INSIDE the if st.button(...) block ---
 
-        all_pages_text = "\n".join(pages_text)
-        text_chunks = chunk_text(all_pages_text)
+        text_chunks = pack_pages(pages_text)
 
         st.session_state.generated_json_data = None
         st.session_state.csv_tables_generated = None
 
         with st.spinner(f"Asking Gemini to convert PDF text to structured JSON... (processing {len(text_chunks)} chunk(s))"):
-            all_json_responses = []
-            model_json = genai.GenerativeModel(model_name='gemini-2.5-pro-preview-06-05')
-            generation_config_json = genai.types.GenerationConfig(
-                response_mime_type="application/json",
-                temperature=0.1
-            )
+            merged_data = {}
+            final_json_text = ""
             
-            for i, chunk in enumerate(text_chunks):
-                st.info(f"Processing chunk {i+1}/{len(text_chunks)}...")
-                prompt_parts = [
-                    few_shot_for_json_prompt,
-                    "You are a data extraction expert. Convert the following text extracted from a PDF into a single, well-structured JSON object.",
-                    "The JSON should represent all the tables and their relationships as described in the context.",
-                    f"CONTEXT:\n{edited_context}\n\nRELATIONSHIPS:\n{edited_relationships}\n\nADDITIONAL CONTEXT:\n{additional_context_text}\n\nMANUAL CONTEXT:\n{user_context}",
-                    "Ensure the JSON is valid and accurately captures all data points, including hierarchical structures.",
-                    f"PDF TEXT CHUNK:\n```text\n{chunk}\n```"
-                ]
-                try:
-                    final_prompt = "\n".join(filter(None, prompt_parts))
-                    response = model_json.generate_content(final_prompt, generation_config=generation_config_json)
-                    all_json_responses.append(response.text)
-                    time.sleep(1)
-                except Exception as e:
-                    handle_api_error(e, f"JSON generation on chunk {i+1}")
+            preamble_parts = [
+                few_shot_for_json_prompt,
+                "You are a data extraction expert. Convert the following text extracted from a PDF into a single, well-structured JSON object.",
+                "The JSON should represent all the tables and their relationships as described in the context.",
+                f"CONTEXT:\n{edited_context}\n\nRELATIONSHIPS:\n{edited_relationships}\n\nADDITIONAL CONTEXT:\n{additional_context_text}\n\nMANUAL CONTEXT:\n{user_context}",
+                "Ensure the JSON is valid and accurately captures all data points, including hierarchical structures.",
+            ]
+            json_preamble = "\n".join(filter(None, preamble_parts))
+            chunk_prompts = [f"PDF TEXT CHUNK:\n```text\n{chunk}\n```" for chunk in text_chunks]
+            # Digests of the cached_generate entries behind each chunk; stays empty on the cached-content path
+            chunk_hashes = []
+
+            # With several chunks, upload the shared preamble once as explicit cached content
+            context_cache = create_context_cache(json_preamble) if len(chunk_prompts) > 1 else None
+            try:
+                # Chunks are independent, so send them concurrently; results are collected in chunk order
+                st.info(f"Processing {len(chunk_prompts)} chunk(s) with up to {MAX_CONCURRENT_REQUESTS} concurrent requests...")
+                with ThreadPoolExecutor(max_workers=max(1, min(len(chunk_prompts), MAX_CONCURRENT_REQUESTS))) as executor:
+                    if context_cache is not None:
+                        model_json = genai.GenerativeModel.from_cached_content(
+                            context_cache,
+                            generation_config=genai.types.GenerationConfig(response_mime_type="application/json", temperature=0.1),
+                        )
+                        futures = [executor.submit(generate_from_cached_content, model_json, chunk_prompt) for chunk_prompt in chunk_prompts]
+                    else:
+                        json_prompts = [f"{json_preamble}\n{chunk_prompt}" for chunk_prompt in chunk_prompts]
+                        chunk_hashes = [prompt_digest(GEMINI_MODEL_NAME, final_prompt, 0.1) for final_prompt in json_prompts]
+                        futures = [
+                            executor.submit(
+                                cached_generate, GEMINI_MODEL_NAME, api_key_fingerprint, prompt_hash, final_prompt,
+                                **JSON_GENERATION_OPTIONS
+                            )
+                            for prompt_hash, final_prompt in zip(chunk_hashes, json_prompts)
+                        ]
+                    if len(futures) > 1:
+                        st.warning("Multiple text chunks were processed. Attempting to merge JSON outputs. Review the result carefully.")
+                    for i, future in enumerate(futures):
+                        try:
+                            json_str = future.result()
+                        except Exception as e:
+                            handle_api_error(e, f"JSON generation on chunk {i+1}")
+                        futures[i] = None
+                        if len(futures) == 1:
+                            final_json_text = json_str
+                            continue
+                        # Merge each fragment as soon as it arrives (still in chunk order), so the raw
+                        # responses are released one by one instead of all being held until the end
+                        try:
+                            data = json_loads(json_str)
+                            if isinstance(data, dict):
+                                deep_merge(merged_data, data)
+                            else:
+                                st.warning(f"Cannot merge JSON response of type {type(data)}. Appending as string.")
+                        except json.JSONDecodeError:
+                            st.error(f"Failed to decode a JSON chunk. The chunk will be skipped:\n{json_str[:500]}")
+                            # Do not replay the broken reply on the next run
+                            if chunk_hashes:
+                                forget_generated(GEMINI_MODEL_NAME, api_key_fingerprint, chunk_hashes[i], **JSON_GENERATION_OPTIONS)
+            finally:
+                if context_cache is not None:
+                    # The cache also expires on its own TTL, so a failed delete is not worth reporting
+                    with contextlib.suppress(*CONTEXT_CACHE_ERRORS):
+                        context_cache.delete()
             
-            if len(all_json_responses) > 1:
-                st.warning("Multiple text chunks were processed. Attempting to merge JSON outputs. Review the result carefully.")
-                merged_data = {}
-                for json_str in all_json_responses:
-                    try:
-                        data = json.loads(json_str)
-                        if isinstance(data, dict):
-                            merged_data.update(data)
-                        else:
-                            st.warning(f"Cannot merge JSON response of type {type(data)}. Appending as string.")
-                    except json.JSONDecodeError:
-                        st.error(f"Failed to decode a JSON chunk. The chunk will be skipped:\n{json_str[:500]}")
-                final_json_text = json.dumps(merged_data, indent=2)
-            elif all_json_responses:
-                final_json_text = all_json_responses[0]
-            else:
+            if not chunk_prompts:
                 st.error("No JSON was generated from the PDF text.")
                 st.stop()
+            elif len(chunk_prompts) > 1:
+                final_json_text = json_dumps_pretty(merged_data)
+            else:
+                try:
+                    merged_data = json_loads(final_json_text)
+                except json.JSONDecodeError:
+                    merged_data = None
+                    if chunk_hashes:
+                        forget_generated(GEMINI_MODEL_NAME, api_key_fingerprint, chunk_hashes[0], **JSON_GENERATION_OPTIONS)
                 
             st.session_state.generated_json_data = final_json_text
+            # Parsed form for display, so st.json does not re-parse the text on every rerun
+            st.session_state.generated_json_dict = merged_data
             st.success("Successfully generated structured JSON from PDF text.")
 
 # --- PART 2: Place this section AFTER the if st.button(...) block, at the same indentation level ---
 
     if 'generated_json_data' in st.session_state and st.session_state.generated_json_data:
         st.subheader("View Generated JSON")
-        st.json(st.session_state.generated_json_data)
+        st.json(st.session_state.get('generated_json_dict') or st.session_state.generated_json_data)
         
         with st.spinner("Asking Gemini to convert JSON to final CSV tables..."):
             try:
-                model_csv = genai.GenerativeModel(model_name='gemini-2.5-pro-preview-06-05')
-                generation_config_csv = genai.types.GenerationConfig(temperature=0.0)
-
                 csv_prompt_parts = [
                     "You are a data transformation expert. Your task is to convert the provided JSON data into multiple, distinct, relational CSV tables as specified.",
                     f"You must generate exactly {num_tables} CSV table(s).",
@@ -471,14 +776,17 @@ Now, apply the same logic and structure from the example to the real input below
                 ]
 
                 final_csv_prompt = "\n".join(filter(None, csv_prompt_parts))
-                csv_response = model_csv.generate_content(final_csv_prompt, generation_config=generation_config_csv)
+                csv_prompt_hash = prompt_digest(GEMINI_MODEL_NAME, final_csv_prompt, 0.0)
+                csv_response_text = cached_generate(
+                    GEMINI_MODEL_NAME, api_key_fingerprint, csv_prompt_hash, final_csv_prompt, **CSV_GENERATION_OPTIONS
+                )
                 
-                table_pattern = re.compile(r"=== START OF TABLE: (.*?) ===\n(.*?)\n=== END OF TABLE: \1 ===", re.DOTALL)
-                matches = table_pattern.findall(csv_response.text)
+                matches = split_tables(csv_response_text)
 
                 if not matches:
+                    forget_generated(GEMINI_MODEL_NAME, api_key_fingerprint, csv_prompt_hash, **CSV_GENERATION_OPTIONS)
                     st.error("The model did not return any data in the expected format. The generation failed.")
-                    st.code(csv_response.text, language='text')
+                    st.code(csv_response_text, language='text')
                 else:
                     generated_tables = {}
                     for name, csv_data in matches:
@@ -508,11 +816,11 @@ Now, apply the same logic and structure from the example to the real input below
                     df_to_display = generated_tables_data[table_name]
                     st.dataframe(df_to_display)
                     
-                    csv_buffer = StringIO()
-                    df_to_display.to_csv(csv_buffer, index=False)
+                    # to_csv(None) returns the text directly, skipping the StringIO buffer and its getvalue() copy
+                    csv_data = df_to_display.to_csv(index=False).encode("utf-8")
                     st.download_button(
                         label=f"Download {table_name}.csv",
-                        data=csv_buffer.getvalue(),
+                        data=csv_data,
                         file_name=f"{table_name}.csv",
                         mime="text/csv",
                         key=f"download_{table_name}"
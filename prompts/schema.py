@@ -1,7 +1,7 @@
 """
 Central JSON schema definition and related prompt templates.
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict, Any
 
 # JSON Schema for the output, as a string (to embed in prompts)
@@ -101,8 +101,7 @@ class RelationsModel(BaseModel):
     parent: Optional[str] = None
     children: Optional[List[str]] = None
     missing: Optional[bool] = None
-    class Config:
-        extra = "forbid"
+    model_config = ConfigDict(extra="forbid")
 
 class EntityModel(BaseModel):
     id: str = Field(..., pattern=r'^[a-zA-Z0-9-_]+$')
@@ -110,19 +109,16 @@ class EntityModel(BaseModel):
     name: str
     attributes: Optional[Dict[str, Any]] = None
     relations: Optional[RelationsModel] = None
-    class Config:
-        extra = "forbid"
+    model_config = ConfigDict(extra="forbid")
 
 class RelationshipModel(BaseModel):
     source: str
     target: str
     type: str
     properties: Optional[Dict[str, Any]] = None
-    class Config:
-        extra = "forbid"
+    model_config = ConfigDict(extra="forbid")
 
 class OutputModel(BaseModel):
     entities: List[EntityModel]
     relationships: Optional[List[RelationshipModel]] = None
-    class Config:
-        extra = "forbid"
\ No newline at end of file
+    model_config = ConfigDict(extra="forbid")
\ No newline at end of file
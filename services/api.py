@@ -1,13 +1,45 @@
 """
 Wrapper functions for Google Generative AI API calls and error handling.
 """
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import streamlit as st
 import google.generativeai as genai
 
+from services import llm_cache
+from services.rate_limiter import TokenBucket, approx_tokens
+from services.transformer import merge_json_fragments
+from utils.chunk import chunk_text
+
 # Use Gemini model name for all requests
 _MODEL_NAME = "gemini-2.5-pro-preview-06-05"
 
-__all__ = ["handle_api_error", "configure_api", "generate_structured_json", "generate_csv_from_json"]
+# Key the client is currently configured with; genai.configure() discards the SDK's pooled
+# gRPC clients, so it is only called again when the key actually changes.
+_configured_api_key = None
+
+# Shared GenerativeModel for _MODEL_NAME, created on first use and dropped when the key changes
+_model = None
+
+# Sampling temperature for structured JSON extraction
+_JSON_TEMPERATURE = 0.1
+
+# Upper bound on simultaneous per-chunk generation requests
+_MAX_CONCURRENT_REQUESTS = 8
+
+# Default client-side quota (Gemini 2.5 Pro, paid tier 1); adjustable with configure_rate_limits()
+DEFAULT_REQUESTS_PER_MINUTE = 150
+DEFAULT_TOKENS_PER_MINUTE = 2_000_000
+
+# Shared by all worker threads so concurrent chunk requests are paced against one quota
+_rate_limiter = TokenBucket(rpm=DEFAULT_REQUESTS_PER_MINUTE, tpm=DEFAULT_TOKENS_PER_MINUTE)
+
+__all__ = [
+    "DEFAULT_REQUESTS_PER_MINUTE", "DEFAULT_TOKENS_PER_MINUTE", "handle_api_error", "configure_api",
+    "configure_rate_limits", "forget_structured_json", "generate_structured_json", "generate_csv_from_json",
+    "wait_for_quota"
+]
 
 def handle_api_error(e: Exception, step_name: str = "API call") -> None:
     """
@@ -32,41 +64,101 @@ def configure_api(api_key: str) -> bool:
     """
     Configure the Google Generative AI client with the provided API key.
     
+    Reconfiguring with the key already in use is a no-op, so the SDK keeps its existing
+    connections across Streamlit reruns.
+    
     :param api_key: Google AI API key.
     :return: True if configuration succeeded, False if it failed.
     """
+    global _configured_api_key, _model
+    if api_key == _configured_api_key:
+        return True
     try:
         genai.configure(api_key=api_key)
+        _configured_api_key = api_key
+        _model = None
         return True
     except Exception as e:
         st.sidebar.error(f"Failed to configure Google AI API: {e}")
         return False
 
-def generate_structured_json(
-    pages_text: list[str],
+def configure_rate_limits(requests_per_minute: int, tokens_per_minute: int) -> None:
+    """
+    Set the client-side request and token budget applied to all generation calls.
+    
+    :param requests_per_minute: Maximum Gemini requests per minute.
+    :param tokens_per_minute: Maximum estimated input tokens per minute.
+    """
+    _rate_limiter.configure(requests_per_minute, tokens_per_minute)
+
+def wait_for_quota(prompt: str) -> None:
+    """
+    Block until the shared client-side rate limit allows one more request of this size.
+    
+    :param prompt: The prompt about to be sent; its token count is estimated from its length.
+    """
+    _rate_limiter.acquire(approx_tokens(prompt))
+
+def _get_model() -> genai.GenerativeModel:
+    """
+    Return the shared GenerativeModel, constructing it on first use.
+    
+    :return: The model instance for _MODEL_NAME.
+    """
+    global _model
+    if _model is None:
+        _model = genai.GenerativeModel(model_name=_MODEL_NAME)
+    return _model
+
+def _call_model(
+    prompt: str,
+    temperature: float = _JSON_TEMPERATURE,
+    response_mime_type: str | None = "application/json",
+    cache_key: str | None = None,
+    use_cache: bool = True
+) -> str:
+    """
+    Generate a response for a single prompt, serving low-temperature calls from llm_cache.
+    
+    :param prompt: The full prompt text.
+    :param temperature: Sampling temperature for the call.
+    :param response_mime_type: Response MIME type, or None for plain text.
+    :param cache_key: Precomputed llm_cache key for the prompt; derived from the prompt if omitted.
+    :param use_cache: False to neither read nor store this response in llm_cache.
+    :return: The raw response text.
+    """
+    key = None
+    if use_cache and llm_cache.is_cacheable(temperature):
+        key = cache_key or llm_cache.make_key(_MODEL_NAME, prompt, temperature)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+    model = _get_model()
+    config = genai.types.GenerationConfig(response_mime_type=response_mime_type, temperature=temperature)
+    # Wait for quota here rather than letting concurrent requests run into 429 errors
+    wait_for_quota(prompt)
+    response = model.generate_content(prompt, generation_config=config)
+    if key is not None:
+        llm_cache.set(key, response.text)
+    return response.text
+
+def _build_json_preamble(
     context_text: str,
     relationships_text: str,
     additional_context_text: str,
     manual_context_text: str,
-    examples: list[tuple[str, str]] = None
+    examples: list[tuple[str, str]] | None
 ) -> str:
     """
-    Send the PDF text (possibly chunked) to the LLM to generate a structured JSON string following the schema.
+    Build the part of the structured-JSON prompt that is shared by every chunk.
     
-    Optionally includes few-shot examples in the prompt, and ensures the output JSON conforms to the schema.
-    
-    :param pages_text: List of page text strings extracted from the PDF.
-    :param context_text: Context prompt text (user-edited or auto-generated).
+    :param context_text: Context prompt text.
     :param relationships_text: Relationships description text.
     :param additional_context_text: Additional context text.
     :param manual_context_text: Manual context input from user.
-    :param examples: Optional list of (example_pdf_text, example_json_text) pairs for few-shot prompting.
-    :return: The JSON output as a string.
+    :param examples: Optional list of (example_pdf_text, example_json_text) pairs.
+    :return: The preamble, ending just before the chunk text.
     """
-    full_text = "\n".join(pages_text)
-    from utils.chunk import chunk_text
-    text_chunks = chunk_text(full_text)
-    all_responses: list[str] = []
     from prompts.schema import SCHEMA_JSON
     example_prompt = ""
     if examples:
@@ -78,32 +170,108 @@ def generate_structured_json(
                 f"--- END OF EXAMPLE {i} ---\n"
             )
         example_prompt += "Now, apply the same logic and structure from these example(s) to the real input below.\n"
-    for idx, chunk in enumerate(text_chunks, start=1):
-        st.info(f"Processing chunk {idx}/{len(text_chunks)}...")
-        prompt = (
-            f"{example_prompt}"
-            "You are a data extraction expert. Convert the following text extracted from a PDF into a single, well-structured JSON object.\n"
-            "The JSON output must strictly follow the given schema:\n"
-            f"```json\n{SCHEMA_JSON}\n```\n"
-            "All required fields must be present. If a required field is missing or null, double-check the input and do not omit the field.\n"
-            "Optional fields can be omitted if no data, but include a \"missing\": true flag within the field object to indicate it is missing.\n"
-            f"CONTEXT:\n{context_text}\n\nRELATIONSHIPS:\n{relationships_text}\n\nADDITIONAL CONTEXT:\n{additional_context_text}\n\nMANUAL CONTEXT:\n{manual_context_text}\n"
-            "Ensure the JSON is valid and accurately captures all tables and hierarchical relationships.\n"
-            f"PDF TEXT CHUNK:\n```text\n{chunk}\n```"
-        )
-        try:
-            model = genai.GenerativeModel(model_name=_MODEL_NAME)
-            config = genai.types.GenerationConfig(response_mime_type="application/json", temperature=0.1)
-            response = model.generate_content(prompt, generation_config=config)
-            all_responses.append(response.text)
-        except Exception as e:
-            handle_api_error(e, f"JSON generation on chunk {idx}")
+
+    # Everything except the chunk is identical across requests, so it is built once and kept at
+    # index 0 of every prompt: Gemini's implicit prompt cache matches on the longest shared prefix.
+    # Static instructions and schema lead, per-run examples/context follow, and the chunk goes last.
+    return (
+        "You are a data extraction expert. Convert the following text extracted from a PDF into a single, well-structured JSON object.\n"
+        "The JSON output must strictly follow the given schema:\n"
+        f"```json\n{SCHEMA_JSON}\n```\n"
+        "All required fields must be present. If a required field is missing or null, double-check the input and do not omit the field.\n"
+        "Optional fields can be omitted if no data, but include a \"missing\": true flag within the field object to indicate it is missing.\n"
+        f"{example_prompt}"
+        f"CONTEXT:\n{context_text}\n\nRELATIONSHIPS:\n{relationships_text}\n\nADDITIONAL CONTEXT:\n{additional_context_text}\n\nMANUAL CONTEXT:\n{manual_context_text}\n"
+        "Ensure the JSON is valid and accurately captures all tables and hierarchical relationships.\n"
+        "PDF TEXT CHUNK:\n"
+    )
+
+def _chunk_cache_key(preamble_hash: str, chunk: str) -> str:
+    """
+    Return the llm_cache key of one structured-JSON chunk request.
+    
+    :param preamble_hash: Hex SHA-256 digest of the shared preamble.
+    :param chunk: The chunk text.
+    :return: The cache key.
+    """
+    return llm_cache.make_chunk_key(_MODEL_NAME, preamble_hash, chunk, _JSON_TEMPERATURE)
+
+def forget_structured_json(
+    pages_text: list[str],
+    context_text: str,
+    relationships_text: str,
+    additional_context_text: str,
+    manual_context_text: str,
+    examples: list[tuple[str, str]] | None = None
+) -> None:
+    """
+    Drop the cached chunk responses behind a generate_structured_json call, e.g. after its
+    output failed validation, so the next attempt asks the model again.
+    
+    Takes the same arguments as generate_structured_json.
+    """
+    preamble = _build_json_preamble(context_text, relationships_text, additional_context_text, manual_context_text, examples)
+    preamble_hash = hashlib.sha256(preamble.encode("utf-8")).hexdigest()
+    for chunk in chunk_text("\n".join(pages_text)):
+        llm_cache.delete(_chunk_cache_key(preamble_hash, chunk))
+
+def generate_structured_json(
+    pages_text: list[str],
+    context_text: str,
+    relationships_text: str,
+    additional_context_text: str,
+    manual_context_text: str,
+    examples: list[tuple[str, str]] = None,
+    use_cache: bool = True
+) -> str:
+    """
+    Send the PDF text (possibly chunked) to the LLM to generate a structured JSON string following the schema.
+    
+    Optionally includes few-shot examples in the prompt, and ensures the output JSON conforms to the schema.
+    
+    :param pages_text: List of page text strings extracted from the PDF.
+    :param context_text: Context prompt text (user-edited or auto-generated).
+    :param relationships_text: Relationships description text.
+    :param additional_context_text: Additional context text.
+    :param manual_context_text: Manual context input from user.
+    :param examples: Optional list of (example_pdf_text, example_json_text) pairs for few-shot prompting.
+    :param use_cache: False to bypass llm_cache for this call, e.g. when the user switched it off.
+    :return: The JSON output as a string.
+    """
+    text_chunks = chunk_text("\n".join(pages_text))
+    preamble = _build_json_preamble(context_text, relationships_text, additional_context_text, manual_context_text, examples)
+    preamble_hash = hashlib.sha256(preamble.encode("utf-8")).hexdigest()
+
+    def prompt_for(chunk: str) -> str:
+        return preamble + "```text\n" + chunk + "\n```"
+
+    def submit(executor: ThreadPoolExecutor, chunk: str):
+        cache_key = _chunk_cache_key(preamble_hash, chunk)
+        return executor.submit(_call_model, prompt_for(chunk), cache_key=cache_key, use_cache=use_cache)
+
+    # Chunks are independent, so they are generated concurrently; results are slotted back by
+    # index so the merge order matches the document order. Streamlit calls stay on this thread.
+    results: list[str | None] = [None] * len(text_chunks)
+    # One widget updated in place instead of an info message per chunk
+    progress_bar = st.progress(0.0, text=f"Processing {len(text_chunks)} chunk(s)...")
+    with ThreadPoolExecutor(max_workers=max(1, min(len(text_chunks), _MAX_CONCURRENT_REQUESTS))) as executor:
+        futures = {submit(executor, chunk): idx for idx, chunk in enumerate(text_chunks)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
+            except Exception as e:
+                for pending in futures:
+                    pending.cancel()
+                handle_api_error(e, f"JSON generation on chunk {idx + 1}")
+            progress_bar.progress(done / len(text_chunks), text=f"Processed chunk {done}/{len(text_chunks)}")
+    progress_bar.empty()
+    all_responses = [text for text in results if text is not None]
     if not all_responses:
         st.error("No JSON was generated from the PDF text.")
         st.stop()
-    from services.transformer import merge_json_fragments
-    final_json = merge_json_fragments(all_responses)
-    return final_json
+    # A single fragment is already the document's JSON; only multi-chunk output needs merging
+    return all_responses[0] if len(all_responses) == 1 else merge_json_fragments(all_responses)
 
 def generate_csv_from_json(
     json_text: str,
@@ -112,7 +280,8 @@ def generate_csv_from_json(
     relationships_text: str,
     additional_context_text: str,
     manual_context_text: str,
-    example_snippets: list[str] = None
+    example_snippets: list[str] = None,
+    use_cache: bool = True
 ) -> str:
     """
     Use the LLM to convert the structured JSON into relational CSV tables.
@@ -126,6 +295,7 @@ def generate_csv_from_json(
     :param additional_context_text: Additional context text.
     :param manual_context_text: Manual context from user input.
     :param example_snippets: Optional list of example CSV snippet strings.
+    :param use_cache: False to bypass llm_cache for this call.
     :return: A single string containing all tables in the specified output format.
     """
     csv_examples_section = ""
@@ -133,25 +303,23 @@ def generate_csv_from_json(
         csv_examples_section = "CSV EXAMPLES:\n" + "\n".join(example_snippets)
     else:
         csv_examples_section = "No CSV examples provided."
+    # Static instructions lead and the JSON payload goes last to keep the prompt prefix cacheable.
     prompt = (
         "You are a data transformation expert. Your task is to convert the provided JSON data into multiple, distinct, relational CSV tables as specified.\n"
-        f"You must generate exactly {len(table_names)} CSV table(s).\n"
-        f"The required table names are: {', '.join(table_names)}.\n"
         "Use the provided context, relationships, and CSV examples to determine the correct columns and data for each table.\n"
-        f"CONTEXT:\n{context_text}\n\nRELATIONSHIPS:\n{relationships_text}\n\nADDITIONAL CONTEXT:\n{additional_context_text}\n\nMANUAL CONTEXT:\n{manual_context_text}\n"
-        f"{csv_examples_section}\n"
         "Follow these output instructions precisely:\n"
         "1. For each table, start with a header line: `=== START OF TABLE: [TableName] ===`\n"
         "2. Then, provide the CSV data for that table, with a header row and comma-separated values.\n"
         "3. End each table's data with a footer line: `=== END OF TABLE: [TableName] ===`\n"
         "4. Ensure the data is properly normalized across the tables as per the relational schema description.\n"
+        f"You must generate exactly {len(table_names)} CSV table(s).\n"
+        f"The required table names are: {', '.join(table_names)}.\n"
+        f"CONTEXT:\n{context_text}\n\nRELATIONSHIPS:\n{relationships_text}\n\nADDITIONAL CONTEXT:\n{additional_context_text}\n\nMANUAL CONTEXT:\n{manual_context_text}\n"
+        f"{csv_examples_section}\n"
         f"JSON DATA TO TRANSFORM:\n```json\n{json_text}\n```"
     )
     try:
-        model = genai.GenerativeModel(model_name=_MODEL_NAME)
-        config = genai.types.GenerationConfig(temperature=0.0)
-        response = model.generate_content(prompt, generation_config=config)
-        return response.text
+        return _call_model(prompt, temperature=0.0, response_mime_type=None, use_cache=use_cache)
     except Exception as e:
         handle_api_error(e, "CSV generation from JSON")
         return ""
\ No newline at end of file
@@ -1,11 +1,27 @@
 """
 PDF table extraction utilities using PyMuPDF.
 """
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
 import fitz  # PyMuPDF
 
-__all__ = ["extract_tables_from_pdf"]
+__all__ = ["extract_tables_from_pdf", "extract_text_from_pdf"]
+
+# Starting a spawn pool takes over a second (about 600 pages of sequential extraction, which runs
+# at about 2 ms per page), so worker processes are only used for very long documents
+_PARALLEL_MIN_PAGES = 1000
+
+# Default "text" flags minus ligature and whitespace preservation: ligatures are expanded to plain
+# letters and tabs/odd spaces become regular spaces, which is cheaper and reads the same to the model
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES & ~fitz.TEXT_PRESERVE_WHITESPACE
 
-def extract_tables_from_pdf(pdf_bytes: bytes, method: str = "auto") -> list[str]:
+# find_tables() strategy per detection method; None (also used for unknown methods) is PyMuPDF's default
+_TABLE_STRATEGIES = {"auto": None, "lattice": "lines", "matrix": "text"}
+
+def extract_tables_from_pdf(pdf_bytes: bytes | memoryview, method: str = "auto") -> list[str]:
     """
     Extract table data (and other text as fallback) from a PDF file.
     
@@ -13,7 +29,7 @@ def extract_tables_from_pdf(pdf_bytes: bytes, method: str = "auto") -> list[str]
     If tables are detected, returns the text content of each table.
     If no tables are found on a page, falls back to raw text extraction for that page.
     
-    :param pdf_bytes: The PDF file content as bytes.
+    :param pdf_bytes: The PDF file content as bytes, or a zero-copy memoryview over it.
     :param method: Table detection method: 
                    "auto" (auto-detect, tries line-based then text-based), 
                    "lattice" (line-based detection only), 
@@ -21,49 +37,88 @@ def extract_tables_from_pdf(pdf_bytes: bytes, method: str = "auto") -> list[str]
     :return: A list of strings, where each string corresponds to the content of one PDF page.
     """
     pages_content: list[str] = []
+    strategy = _TABLE_STRATEGIES.get(method)
     # Open PDF from bytes
     doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     try:
         for page in doc:
             page_text = ""
-            tables = None
-            # Choose detection strategy based on method
-            if method == "auto":
-                table_finder = page.find_tables()
-                tables = [tbl for tbl in table_finder] if table_finder else []
-                if not tables:
-                    # If no tables with default, try text-based detection
-                    table_finder = page.find_tables(strategy="text")
-                    tables = [tbl for tbl in table_finder] if table_finder else []
-            elif method == "lattice":
-                table_finder = page.find_tables(strategy="lines")
-                tables = [tbl for tbl in table_finder] if table_finder else []
-            elif method == "matrix":
-                table_finder = page.find_tables(strategy="text")
-                tables = [tbl for tbl in table_finder] if table_finder else []
-            else:
-                # Unknown method, default to auto
-                table_finder = page.find_tables()
-                tables = [tbl for tbl in table_finder] if table_finder else []
-            if tables and len(tables) > 0:
-                # Extract all tables on the page
-                table_texts = []
+            finder = page.find_tables() if strategy is None else page.find_tables(strategy=strategy)
+            tables = finder.tables
+            if not tables and method == "auto":
+                # If no tables with default, try text-based detection
+                tables = page.find_tables(strategy="text").tables
+            if tables:
+                # Extract all tables on the page: one line per row, tables separated by a blank line
+                table_blocks = []
                 for t in tables:
                     try:
                         data = t.extract()  # list of list of strings
                     except AttributeError:
-                        data = []
                         # Could implement manual extraction via cell bounding boxes if needed.
+                        continue
                     if data:
-                        for row in data:
-                            line = ", ".join(str(cell) for cell in row)
-                            table_texts.append(line)
-                        table_texts.append("")
-                page_text = "\n".join(table_texts).strip()
+                        table_blocks.append("\n".join([", ".join(map(str, row)) for row in data]))
+                page_text = "\n\n".join(table_blocks).strip()
             else:
                 # No table found, fallback to entire page text
-                page_text = page.get_text().strip()
+                page_text = page.get_text("text", sort=False, flags=_TEXT_FLAGS).strip()
             pages_content.append(page_text if page_text is not None else "")
     finally:
         doc.close()
-    return pages_content
\ No newline at end of file
+    return pages_content
+
+def _extract_page_range(path: str, start: int, stop: int) -> list[str]:
+    """
+    Extract the plain text of pages [start, stop) using a document handle private to the caller.
+    """
+    doc = fitz.open(path)
+    try:
+        return [doc[i].get_text("text", sort=False, flags=_TEXT_FLAGS) for i in range(start, stop)]
+    finally:
+        doc.close()
+
+def extract_text_from_pdf(source: bytes | memoryview | str, max_workers: int = 1) -> list[str]:
+    """
+    Extract the plain text of every page of a PDF.
+    
+    Pages are extracted in-process by default. PyMuPDF documents must not be shared between
+    threads, so callers may opt into worker processes, each opening its own handle on a page
+    range; this only applies to documents of at least _PARALLEL_MIN_PAGES pages.
+    
+    :param source: The PDF content as bytes (or a zero-copy memoryview), or a filesystem path to the PDF.
+    :param max_workers: Maximum number of worker processes; 1 (the default) extracts sequentially.
+    :return: A list of strings, one per page, in page order.
+    """
+    doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    try:
+        page_count = doc.page_count
+        workers = min(max_workers, page_count)
+        if page_count < _PARALLEL_MIN_PAGES or workers < 2:
+            return [page.get_text("text", sort=False, flags=_TEXT_FLAGS) for page in doc]
+    finally:
+        doc.close()
+    step = -(-page_count // workers)
+    bounds = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    if isinstance(source, str):
+        return _extract_in_workers(source, bounds)
+    # Workers get a path rather than the bytes, so the PDF is written once instead of being
+    # pickled again for every worker
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(source)
+        return _extract_in_workers(path, bounds)
+    finally:
+        os.unlink(path)
+
+def _extract_in_workers(path: str, bounds: list[tuple[int, int]]) -> list[str]:
+    """
+    Extract the given page ranges of the PDF at path in worker processes, in order.
+    """
+    # spawn rather than fork: the caller (Streamlit, gRPC) is multi-threaded, and forking a
+    # multi-threaded process can deadlock the child
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(bounds), mp_context=context) as executor:
+        futures = [executor.submit(_extract_page_range, path, start, stop) for start, stop in bounds]
+        return [text for future in futures for text in future.result()]
@@ -0,0 +1,190 @@
+"""
+Persistent exact-match cache for deterministic LLM responses.
+
+Responses are stored in a SQLite database under ~/.cache/ssdc/ (override with the
+SSDC_CACHE_DIR environment variable), keyed on a SHA-256 digest of the model name,
+prompt and temperature. Entries expire after CACHE_TTL_SECONDS, and once the store grows
+beyond CACHE_MAX_ENTRIES the oldest are evicted in one batch and the freed pages returned
+to the file system. Set SSDC_LLM_CACHE=0 to disable it for the process; single calls can
+skip it through the use_cache argument of the services.api functions.
+The cache is best effort: storage errors are treated as misses.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+__all__ = [
+    "CACHE_MAX_ENTRIES",
+    "CACHE_TTL_SECONDS",
+    "MAX_CACHEABLE_TEMPERATURE",
+    "delete",
+    "get",
+    "is_cacheable",
+    "is_enabled",
+    "make_chunk_key",
+    "make_key",
+    "set",
+    "stats",
+]
+
+# Sampling above this temperature is not reproducible enough to replay a stored response
+MAX_CACHEABLE_TEMPERATURE = 0.1
+
+# Stored responses older than this are ignored and eventually evicted
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# Upper bound on stored responses; the oldest are evicted first
+CACHE_MAX_ENTRIES = 2000
+
+# Eviction trims the store to this fraction of CACHE_MAX_ENTRIES, so it runs once per batch of
+# inserts rather than on every insert past the bound
+_EVICT_TO_FRACTION = 0.9
+
+_CACHE_DIR = os.environ.get("SSDC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ssdc"))
+_CACHE_PATH = os.path.join(_CACHE_DIR, "llm_responses.sqlite3")
+
+# Failures of the on-disk store that are treated as a cache miss
+_STORE_ERRORS = (sqlite3.Error, OSError)
+
+# One connection is shared by the thread pool that generates chunks, so access is serialized
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+_conn_path: str | None = None
+
+_enabled = os.environ.get("SSDC_LLM_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+stats = {"hits": 0, "misses": 0}
+
+def is_enabled() -> bool:
+    """
+    Check whether the cache is enabled for this process.
+
+    :return: False when SSDC_LLM_CACHE disables the cache.
+    """
+    return _enabled
+
+def is_cacheable(temperature: float) -> bool:
+    """
+    Check whether a call made at the given temperature may be served from the cache.
+
+    :param temperature: Sampling temperature of the call.
+    :return: True if the cache is enabled and responses at this temperature are cached.
+    """
+    return _enabled and temperature <= MAX_CACHEABLE_TEMPERATURE
+
+def make_key(model_name: str, prompt: str, temperature: float) -> str:
+    """
+    Build the cache key for a generation request.
+
+    :param model_name: Name of the model the prompt is sent to.
+    :param prompt: The full prompt text.
+    :param temperature: Sampling temperature of the call.
+    :return: Hex SHA-256 digest identifying the request.
+    """
+    payload = json.dumps({"model": model_name, "prompt": prompt, "temp": temperature}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def make_chunk_key(model_name: str, preamble_hash: str, chunk: str, temperature: float) -> str:
+    """
+    Build a two-level cache key for a prompt made of a shared preamble plus a varying chunk.
+
+    The first level identifies the prompt template (model, preamble digest and temperature),
+    the second the chunk body, so the preamble is hashed once per run rather than per chunk.
+
+    :param model_name: Name of the model the prompt is sent to.
+    :param preamble_hash: Hex SHA-256 digest of the shared preamble.
+    :param chunk: The chunk text appended to the preamble.
+    :param temperature: Sampling temperature of the call.
+    :return: Key of the form "<template digest>:<chunk digest>".
+    """
+    template_key = make_key(model_name, preamble_hash, temperature)
+    return f"{template_key}:{hashlib.sha256(chunk.encode('utf-8')).hexdigest()}"
+
+def _connection() -> sqlite3.Connection:
+    """
+    Return the open connection to _CACHE_PATH, creating the database on first use.
+    Must be called with _lock held.
+    """
+    global _conn, _conn_path
+    if _conn is None or _conn_path != _CACHE_PATH:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        os.makedirs(os.path.dirname(_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(_CACHE_PATH, check_same_thread=False, isolation_level=None)
+        # Set before the table exists, so pages freed by eviction can be handed back to the file system
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+        _conn, _conn_path = conn, _CACHE_PATH
+    return _conn
+
+def get(key: str) -> str | None:
+    """
+    Look up a cached response and update the hit/miss counters.
+
+    :param key: Key returned by make_key or make_chunk_key.
+    :return: The cached response text, or None on a miss, an expired entry or a disabled cache.
+    """
+    if not _enabled:
+        return None
+    with _lock:
+        try:
+            row = _connection().execute(
+                "SELECT value FROM responses WHERE key = ? AND stored_at >= ?", (key, time.time() - CACHE_TTL_SECONDS)
+            ).fetchone()
+        except _STORE_ERRORS:
+            row = None
+        value = row[0] if row is not None else None
+        stats["hits" if value is not None else "misses"] += 1
+    return value
+
+def set(key: str, value: str) -> None:
+    """
+    Store a response in the cache, evicting expired and excess entries.
+
+    :param key: Key returned by make_key or make_chunk_key.
+    :param value: Response text to store.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        try:
+            conn = _connection()
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO responses (key, stored_at, value) VALUES (?, ?, ?)", (key, now, value))
+            if conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] > CACHE_MAX_ENTRIES:
+                _evict(conn, now)
+        except _STORE_ERRORS:
+            pass
+
+def _evict(conn: sqlite3.Connection, now: float) -> None:
+    """
+    Drop expired entries, then the oldest ones until the store is at _EVICT_TO_FRACTION of
+    CACHE_MAX_ENTRIES, and release the freed pages.
+    """
+    conn.execute("DELETE FROM responses WHERE stored_at < ?", (now - CACHE_TTL_SECONDS,))
+    excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - int(CACHE_MAX_ENTRIES * _EVICT_TO_FRACTION)
+    if excess > 0:
+        conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY stored_at LIMIT ?)", (excess,)
+        )
+    # Each step of the pragma frees one page, so it has to be run to completion
+    conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+def delete(key: str) -> None:
+    """
+    Remove a response from the cache, e.g. after it failed validation.
+
+    :param key: Key returned by make_key or make_chunk_key.
+    """
+    with _lock:
+        try:
+            _connection().execute("DELETE FROM responses WHERE key = ?", (key,))
+        except _STORE_ERRORS:
+            pass
@@ -0,0 +1,78 @@
+"""
+Client-side request and token rate limiting for Gemini API calls.
+"""
+import threading
+import time
+
+__all__ = ["TokenBucket", "approx_tokens"]
+
+def approx_tokens(prompt: str) -> int:
+    """
+    Estimate the token count of a prompt without a count_tokens round trip.
+
+    :param prompt: The prompt text.
+    :return: Roughly one token per four characters, at least one.
+    """
+    return max(1, len(prompt) // 4)
+
+class TokenBucket:
+    """
+    Thread-safe pair of token buckets enforcing requests-per-minute and tokens-per-minute limits.
+
+    Both buckets start full and refill continuously, so short bursts up to the per-minute limit
+    go straight through and sustained load is paced to the quota instead of hitting 429 errors.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        """
+        :param rpm: Maximum requests per minute.
+        :param tpm: Maximum input tokens per minute.
+        """
+        self._lock = threading.Lock()
+        self.rpm = max(1, int(rpm))
+        self.tpm = max(1, int(tpm))
+        self._request_level = float(self.rpm)
+        self._token_level = float(self.tpm)
+        self._last = time.monotonic()
+
+    def configure(self, rpm: int, tpm: int) -> None:
+        """
+        Change the limits; the current levels are capped to the new capacities.
+
+        :param rpm: Maximum requests per minute.
+        :param tpm: Maximum input tokens per minute.
+        """
+        with self._lock:
+            self._refill()
+            self.rpm = max(1, int(rpm))
+            self.tpm = max(1, int(tpm))
+            self._request_level = min(self._request_level, self.rpm)
+            self._token_level = min(self._token_level, self.tpm)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        self._request_level = min(self.rpm, self._request_level + elapsed * self.rpm / 60)
+        self._token_level = min(self.tpm, self._token_level + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens: int = 1) -> None:
+        """
+        Block until one request and the given number of tokens are available, then take them.
+
+        :param tokens: Estimated tokens of the request; requests larger than the whole
+                       per-minute budget wait for a full bucket rather than forever.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(tokens, self.tpm)
+                if self._request_level >= 1 and self._token_level >= needed:
+                    self._request_level -= 1
+                    self._token_level -= needed
+                    return
+                wait = max(
+                    (1 - self._request_level) * 60 / self.rpm,
+                    (needed - self._token_level) * 60 / self.tpm,
+                )
+            time.sleep(wait)
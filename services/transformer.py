@@ -1,20 +1,52 @@
 """
 Transformation logic for converting between JSON structures, DataFrames, and CSV text.
 """
+import functools
 import re
 import json
 from typing import List, Dict
 from pandas import DataFrame
-from utils.io import robust_read_csv
+from utils.io import robust_read_csv, sniff_dialect
 
-__all__ = ["merge_json_fragments", "parse_tables_from_csv"]
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the standard library
+    orjson = None
+
+__all__ = ["deep_merge", "merge_json_fragments", "parse_tables_from_csv"]
+
+# Matches one "=== START OF TABLE: name === ... === END OF TABLE: name ===" block
+_TABLE_PATTERN = re.compile(r"=== START OF TABLE: (.*?) ===\n(.*?)\n=== END OF TABLE: \1 ===", re.DOTALL)
+
+def deep_merge(dst: dict, src: dict) -> dict:
+    """
+    Merge src into dst in place and return dst.
+    
+    Lists under the same key are concatenated (e.g. "entities" and "relationships" from
+    different chunks), nested dictionaries are merged recursively, and any other value
+    from src replaces the one in dst.
+    
+    :param dst: Dictionary to merge into.
+    :param src: Dictionary whose contents are merged.
+    :return: The updated dst dictionary.
+    """
+    for key, value in src.items():
+        existing = dst.get(key)
+        if isinstance(value, list) and isinstance(existing, list):
+            existing.extend(value)
+        elif isinstance(value, dict) and isinstance(existing, dict):
+            deep_merge(existing, value)
+        else:
+            dst[key] = value
+    return dst
 
 def merge_json_fragments(json_fragments: List[str]) -> str:
     """
     Merge multiple JSON fragment strings into a single JSON string.
     
     If multiple parts are provided (from processing PDF in chunks), each part is parsed and 
-    merged into one JSON object. In case of conflicts, later keys override earlier ones.
+    merged into one JSON object with deep_merge: list values (such as "entities") are
+    concatenated across parts, and for other conflicts later values override earlier ones.
     Non-dictionary JSON fragments are skipped with a warning.
     
     :param json_fragments: List of JSON strings.
@@ -24,17 +56,20 @@ def merge_json_fragments(json_fragments: List[str]) -> str:
         return ""
     if len(json_fragments) == 1:
         return json_fragments[0]
+    loads = orjson.loads if orjson is not None else json.loads
     merged_data: Dict = {}
     for frag in json_fragments:
         try:
-            data = json.loads(frag)
-        except json.JSONDecodeError:
+            data = loads(frag)
+        except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses it
             continue
         if isinstance(data, dict):
-            merged_data.update(data)
+            deep_merge(merged_data, data)
         else:
             continue
     try:
+        if orjson is not None:
+            return orjson.dumps(merged_data, option=orjson.OPT_INDENT_2).decode()
         return json.dumps(merged_data, indent=2)
     except Exception as e:
         return str(merged_data)
@@ -51,10 +86,17 @@ def parse_tables_from_csv(csv_response_text: str) -> Dict[str, DataFrame]:
     :return: A dictionary mapping table name to DataFrame for each parsed table.
     """
     tables: Dict[str, DataFrame] = {}
-    pattern = re.compile(r"=== START OF TABLE: (.*?) ===\n(.*?)\n=== END OF TABLE: \1 ===", re.DOTALL)
-    matches = pattern.findall(csv_response_text)
+    matches = _TABLE_PATTERN.findall(csv_response_text)
+
+    # All tables of one response share formatting, so the fallback dialect is sniffed at most once,
+    # and only if some table fails to parse with the default comma dialect
+    @functools.cache
+    def response_dialect():
+        first_line = next((table_csv.strip().splitlines()[0] for _, table_csv in matches if table_csv.strip()), None)
+        return sniff_dialect(first_line) if first_line else None
+
     for table_name, table_csv in matches:
-        df = robust_read_csv(table_csv)
+        df = robust_read_csv(table_csv, dialect_provider=response_dialect)
         if not df.empty:
             tables[table_name.strip()] = df
         else:
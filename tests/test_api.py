@@ -1,6 +1,14 @@
+import json
 import types
 import pytest
 import services.api as api
+from services import llm_cache
+
+@pytest.fixture(autouse=True)
+def isolated_api_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_cache, "_CACHE_PATH", str(tmp_path / "llm_responses"))
+    monkeypatch.setattr(api, "_model", None)
+    monkeypatch.setattr(llm_cache, "_enabled", True)
 
 class DummyModel:
     def __init__(self, model_name=None):
@@ -15,6 +23,17 @@ class DummyModel:
             text = '{"dummy": true}'
         return types.SimpleNamespace(text=text)
 
+@pytest.fixture
+def model_calls(monkeypatch):
+    """Install a DummyModel that records every prompt it is sent, and return that list."""
+    calls = []
+    class CountingModel(DummyModel):
+        def generate_content(self, prompt, generation_config=None):
+            calls.append(prompt)
+            return super().generate_content(prompt, generation_config)
+    monkeypatch.setattr(api.genai, "GenerativeModel", CountingModel)
+    return calls
+
 def test_handle_api_error(monkeypatch):
     errors = []
     warnings = []
@@ -43,6 +62,25 @@ def test_configure_api(monkeypatch):
     assert result2 is False
     assert any("Failed to configure" in msg for msg in errors)
 
+def test_configure_api_skips_unchanged_key(monkeypatch):
+    calls = []
+    monkeypatch.setattr(api, "_configured_api_key", None)
+    monkeypatch.setattr(api.genai, "configure", lambda api_key=None: calls.append(api_key))
+    assert api.configure_api("SAMEKEY") is True
+    assert api.configure_api("SAMEKEY") is True
+    assert calls == ["SAMEKEY"]
+    assert api.configure_api("NEWKEY") is True
+    assert calls == ["SAMEKEY", "NEWKEY"]
+
+def test_get_model_is_reused_until_key_changes(monkeypatch):
+    monkeypatch.setattr(api, "_configured_api_key", None)
+    monkeypatch.setattr(api.genai, "configure", lambda api_key=None: None)
+    monkeypatch.setattr(api.genai, "GenerativeModel", DummyModel)
+    model = api._get_model()
+    assert api._get_model() is model
+    api.configure_api("KEY")
+    assert api._get_model() is not model
+
 def test_generate_structured_json_single(monkeypatch):
     monkeypatch.setattr(api, "chunk_text", lambda text: [text])
     monkeypatch.setattr(api.genai, "GenerativeModel", DummyModel)
@@ -71,11 +109,31 @@ def test_generate_structured_json_multiple(monkeypatch):
     )
     data = {}
     try:
-        data = __import__("json").loads(result_json)
+        data = json.loads(result_json)
     except Exception:
         pytest.fail("Output is not valid JSON")
     assert data.get("a") == 1 and data.get("b") == 2
 
+def test_generate_structured_json_reuses_cached_chunks(monkeypatch, model_calls):
+    monkeypatch.setattr(api, "chunk_text", lambda text: ["chunk1", "chunk2"])
+    kwargs = {"pages_text": ["page"], "context_text": "CTX", "relationships_text": "REL",
+              "additional_context_text": "ADD", "manual_context_text": "MANUAL", "examples": None}
+    first = api.generate_structured_json(**kwargs)
+    assert api.generate_structured_json(**kwargs) == first
+    assert len(model_calls) == 2
+    monkeypatch.setattr(api, "chunk_text", lambda text: ["chunk1", "chunk3"])
+    api.generate_structured_json(**kwargs)
+    assert len(model_calls) == 3
+
+def test_forget_structured_json_drops_cached_chunks(monkeypatch, model_calls):
+    monkeypatch.setattr(api, "chunk_text", lambda text: ["chunk1"])
+    kwargs = {"pages_text": ["page"], "context_text": "CTX", "relationships_text": "REL",
+              "additional_context_text": "ADD", "manual_context_text": "MANUAL", "examples": None}
+    api.generate_structured_json(**kwargs)
+    api.forget_structured_json(**kwargs)
+    api.generate_structured_json(**kwargs)
+    assert len(model_calls) == 2
+
 def test_generate_csv_from_json(monkeypatch):
     monkeypatch.setattr(api.genai, "GenerativeModel", DummyModel)
     dummy_json = '{"some": "data"}'
@@ -88,4 +146,25 @@ def test_generate_csv_from_json(monkeypatch):
         manual_context_text="MANUAL",
         example_snippets=[]
     )
-    assert '{"dummy": true}' in out_text
\ No newline at end of file
+    assert '{"dummy": true}' in out_text
+
+def test_generate_csv_from_json_uses_cache(model_calls):
+    kwargs = {"json_text": '{"some": "data"}', "table_names": ["TableX"], "context_text": "CTX",
+              "relationships_text": "REL", "additional_context_text": "ADD", "manual_context_text": "MANUAL",
+              "example_snippets": []}
+    first = api.generate_csv_from_json(**kwargs)
+    second = api.generate_csv_from_json(**kwargs)
+    assert first == second
+    assert len(model_calls) == 1
+
+def test_use_cache_false_skips_lookup_and_store(monkeypatch, model_calls):
+    monkeypatch.setattr(llm_cache, "stats", {"hits": 0, "misses": 0})
+    kwargs = {"json_text": '{"some": "data"}', "table_names": ["TableX"], "context_text": "CTX",
+              "relationships_text": "REL", "additional_context_text": "ADD", "manual_context_text": "MANUAL",
+              "example_snippets": []}
+    api.generate_csv_from_json(**kwargs, use_cache=False)
+    api.generate_csv_from_json(**kwargs, use_cache=False)
+    assert len(model_calls) == 2
+    assert llm_cache.stats == {"hits": 0, "misses": 0}
+    api.generate_csv_from_json(**kwargs)
+    assert llm_cache.stats == {"hits": 0, "misses": 1}
@@ -0,0 +1,72 @@
+import fitz
+
+from services import extractor
+
+def create_pdf_bytes(texts: list[str]) -> bytes:
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def test_extract_text_from_pdf_sequential():
+    pdf_bytes = create_pdf_bytes(["first page", "second page"])
+    pages = extractor.extract_text_from_pdf(pdf_bytes)
+    assert len(pages) == 2
+    assert "first page" in pages[0] and "second page" in pages[1]
+
+def test_extract_text_from_pdf_defaults_to_in_process(monkeypatch):
+    monkeypatch.setattr(extractor, "_PARALLEL_MIN_PAGES", 2)
+    def no_workers(path, bounds):
+        raise AssertionError("worker processes started without being requested")
+    monkeypatch.setattr(extractor, "_extract_in_workers", no_workers)
+    pages = extractor.extract_text_from_pdf(create_pdf_bytes(["one", "two", "three"]))
+    assert [t.strip() for t in pages] == ["one", "two", "three"]
+
+def test_extract_text_from_pdf_parallel_keeps_page_order(monkeypatch, tmp_path):
+    monkeypatch.setattr(extractor, "_PARALLEL_MIN_PAGES", 2)
+    texts = [f"page number {i}" for i in range(5)]
+    pdf_path = tmp_path / "doc.pdf"
+    pdf_path.write_bytes(create_pdf_bytes(texts))
+    pages = extractor.extract_text_from_pdf(str(pdf_path), max_workers=2)
+    assert len(pages) == 5
+    for i, page_text in enumerate(pages):
+        assert f"page number {i}" in page_text
+
+def test_extract_text_from_pdf_accepts_memoryview(monkeypatch):
+    monkeypatch.setattr(extractor, "_PARALLEL_MIN_PAGES", 2)
+    pdf_view = memoryview(create_pdf_bytes(["alpha", "beta", "gamma"]))
+    assert [t.strip() for t in extractor.extract_text_from_pdf(pdf_view, max_workers=1)] == ["alpha", "beta", "gamma"]
+    assert [t.strip() for t in extractor.extract_text_from_pdf(pdf_view, max_workers=2)] == ["alpha", "beta", "gamma"]
+
+def test_extract_text_from_pdf_parallel_removes_temp_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(extractor, "_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(extractor.tempfile, "tempdir", str(tmp_path))
+    pages = extractor.extract_text_from_pdf(create_pdf_bytes(["one", "two", "three"]), max_workers=2)
+    assert [t.strip() for t in pages] == ["one", "two", "three"]
+    assert list(tmp_path.iterdir()) == []
+
+def create_grid_pdf_bytes(rows: int = 3, cols: int = 3) -> bytes:
+    doc = fitz.open()
+    page = doc.new_page()
+    for r in range(rows):
+        for c in range(cols):
+            page.insert_text((72 + c * 100, 100 + r * 20), f"r{r}c{c}")
+    for r in range(rows + 1):
+        page.draw_line((60, 85 + r * 20), (370, 85 + r * 20))
+    for x in (60, 160, 260, 370):
+        page.draw_line((x, 85), (x, 85 + rows * 20))
+    doc.new_page().insert_text((72, 72), "plain text page")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def test_extract_tables_from_pdf_methods():
+    pdf_bytes = create_grid_pdf_bytes()
+    expected = "r0c0, r0c1, r0c2\nr1c0, r1c1, r1c2\nr2c0, r2c1, r2c2"
+    for method in ("auto", "lattice", "unknown"):
+        pages = extractor.extract_tables_from_pdf(pdf_bytes, method=method)
+        assert pages[0] == expected
+        assert pages[1] == "plain text page"
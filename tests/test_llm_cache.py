@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from services import llm_cache
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_cache, "_CACHE_PATH", str(tmp_path / "llm_responses"))
+    monkeypatch.setattr(llm_cache, "stats", {"hits": 0, "misses": 0})
+    monkeypatch.setattr(llm_cache, "_enabled", True)
+
+def test_get_set_roundtrip():
+    key = llm_cache.make_key("model", "prompt", 0.0)
+    assert llm_cache.get(key) is None
+    llm_cache.set(key, "response")
+    assert llm_cache.get(key) == "response"
+    assert llm_cache.stats == {"hits": 1, "misses": 1}
+
+def test_make_key_and_cacheable():
+    assert llm_cache.make_key("m", "p", 0.0) != llm_cache.make_key("m", "p", 0.1)
+    assert llm_cache.make_key("m", "p", 0.0) == llm_cache.make_key("m", "p", 0.0)
+    assert llm_cache.is_cacheable(0.1) and not llm_cache.is_cacheable(0.7)
+
+def test_make_chunk_key_separates_template_and_chunk():
+    key = llm_cache.make_chunk_key("m", "preamble-hash", "chunk", 0.1)
+    template, chunk_digest = key.split(":")
+    assert template == llm_cache.make_key("m", "preamble-hash", 0.1)
+    assert llm_cache.make_chunk_key("m", "preamble-hash", "other", 0.1).startswith(template + ":")
+    assert llm_cache.make_chunk_key("m", "other-hash", "chunk", 0.1).split(":")[1] == chunk_digest
+
+def test_entries_expire_and_can_be_deleted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    llm_cache.set("a", "one")
+    llm_cache.set("b", "two")
+    llm_cache.delete("a")
+    assert llm_cache.get("a") is None
+    assert llm_cache.get("b") == "two"
+    now[0] += llm_cache.CACHE_TTL_SECONDS + 1
+    assert llm_cache.get("b") is None
+
+def test_oldest_entries_are_evicted_in_one_batch(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    monkeypatch.setattr(llm_cache, "CACHE_MAX_ENTRIES", 10)
+    keys = [f"k{i}" for i in range(11)]
+    for key in keys:
+        now[0] += 1
+        llm_cache.set(key, key)
+    # Going over the bound trims the store to 90% of it, keeping the newest entries
+    assert [llm_cache.get(key) for key in keys] == [None, None] + keys[2:]
+
+def test_evicted_space_is_reclaimed(monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_MAX_ENTRIES", 50)
+    for i in range(500):
+        llm_cache.set(f"k{i}", "x" * 4096)
+    assert os.path.getsize(llm_cache._CACHE_PATH) < 1024 * 1024
+
+def test_disabled_cache_is_bypassed(monkeypatch):
+    llm_cache.set("a", "one")
+    monkeypatch.setattr(llm_cache, "_enabled", False)
+    assert llm_cache.get("a") is None
+    assert not llm_cache.is_cacheable(0.0)
+    llm_cache.set("b", "two")
+    monkeypatch.setattr(llm_cache, "_enabled", True)
+    assert llm_cache.get("a") == "one"
+    assert llm_cache.get("b") is None
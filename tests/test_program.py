@@ -0,0 +1,135 @@
+import program
+
+def test_split_tables_strips_crlf_and_trailing_newlines():
+    response = (
+        "=== START OF TABLE: A ===\r\na,b\r\n1,2\r\n=== END OF TABLE: A ===\r\n"
+        "=== START OF TABLE: B ===\n\nc\n3\n\n\n=== END OF TABLE: B ===\n"
+    )
+    assert program.split_tables(response) == [("A", "a,b\r\n1,2"), ("B", "c\n3")]
+
+def test_split_tables_pairs_end_markers_by_name():
+    response = "=== START OF TABLE: A ===\nx\n=== END OF TABLE: B ===\ny\n=== END OF TABLE: A ===\n=== END OF TABLE: C ==="
+    assert program.split_tables(response) == [("A", "x\n=== END OF TABLE: B ===\ny")]
+
+def test_robust_read_csv_keeps_rows_before_unclosed_quote():
+    df = program.robust_read_csv('a,b\n1,2,3\n"x')
+    assert df.values.tolist() == [[2, 3]]
+
+def test_robust_read_csv_pads_short_rows_before_unclosed_quote():
+    df = program.robust_read_csv('a,b,c\n1,2\n3,4,5\n"6,7')
+    assert list(df.columns) == ["a", "b", "c"]
+    assert len(df) == 2
+    assert df.iloc[1].tolist() == [3, 4, 5]
+    assert df.iloc[0, :2].tolist() == [1, 2] and df.iloc[0].isna().tolist() == [False, False, True]
+
+class DummyModel:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, prompt, generation_config=None):
+        return type("Response", (), {"text": "{}"})()
+
+def test_chunk_requests_each_take_from_the_rate_limit(monkeypatch):
+    acquired = []
+    monkeypatch.setattr(program, "wait_for_quota", acquired.append)
+    monkeypatch.setattr(program.genai, "GenerativeModel", DummyModel)
+    program.cached_generate.clear()
+    prompts = [f"preamble\nchunk {i}" for i in range(3)]
+    for prompt in prompts:
+        program.cached_generate("model", "key", program.prompt_digest("model", prompt, 0.1), prompt, temperature=0.1)
+    assert acquired == prompts
+    # Replayed responses do not reach the API and take nothing from the limit
+    program.cached_generate("model", "key", program.prompt_digest("model", prompts[0], 0.1), prompts[0], temperature=0.1)
+    assert len(acquired) == 3
+    for prompt in prompts:
+        program.generate_from_cached_content(DummyModel(), prompt)
+    assert acquired == prompts * 2
+    program.cached_generate.clear()
+
+def test_forget_generated_evicts_one_entry(monkeypatch):
+    calls = []
+    monkeypatch.setattr(program, "wait_for_quota", lambda prompt: None)
+    class RecordingModel(DummyModel):
+        def generate_content(self, prompt, generation_config=None):
+            calls.append(prompt)
+            return super().generate_content(prompt, generation_config)
+    monkeypatch.setattr(program.genai, "GenerativeModel", RecordingModel)
+    program.cached_generate.clear()
+    options = program.JSON_GENERATION_OPTIONS
+    for prompt in ("a", "b"):
+        program.cached_generate("model", "key", program.prompt_digest("model", prompt), prompt, **options)
+    program.cached_generate("model", "key", program.prompt_digest("model", "a"), "a", **options)
+    assert calls == ["a", "b"]
+    # Entries are per API key
+    program.cached_generate("model", "other key", program.prompt_digest("model", "a"), "a", **options)
+    assert calls == ["a", "b", "a"]
+    program.forget_generated("model", "key", program.prompt_digest("model", "a"), **options)
+    for prompt in ("a", "b"):
+        program.cached_generate("model", "key", program.prompt_digest("model", prompt), prompt, **options)
+    assert calls == ["a", "b", "a", "a"]
+    program.cached_generate.clear()
+
+def test_chunk_text_prefers_newlines_then_spaces():
+    assert program.chunk_text("  alpha beta\ngamma delta\nepsilon  ", max_chars=12) == ["alpha beta", "gamma delta", "epsilon"]
+    assert program.chunk_text("aaaa bbbb cccc", max_chars=10) == ["aaaa bbbb", "cccc"]
+
+def test_chunk_text_limits_and_boundaries():
+    assert program.chunk_text("x" * 25, max_chars=10) == ["x" * 10, "x" * 10, "x" * 5]
+    # A newline exactly at the limit still ends the chunk there
+    assert program.chunk_text("abcdefghij\nk", max_chars=10) == ["abcdefghij", "k"]
+    assert program.chunk_text("one\ntwo\nthree", max_chars=100) == ["one\ntwo\nthree"]
+    assert program.chunk_text("  \n ", max_chars=5) == []
+
+def test_chunk_text_keeps_all_content_within_the_limit():
+    text = "\n".join(" ".join(f"w{i}_{j}" for j in range(i % 7 + 1)) for i in range(300))
+    chunks = program.chunk_text(text, max_chars=200)
+    assert all(0 < len(chunk) <= 200 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+def test_pack_pages_packs_whole_pages_up_to_the_limit():
+    # "aaaa\nbbbb" is exactly 9 characters, so a third page starts a new chunk
+    assert program.pack_pages(["aaaa", "bbbb", "cccc"], max_chars=9) == ["aaaa\nbbbb", "cccc"]
+    assert program.pack_pages(["aaaa", "bbbb"], max_chars=8) == ["aaaa", "bbbb"]
+    assert program.pack_pages(["aaaa", "", "  ", " bbbb\n"], max_chars=9) == ["aaaa\nbbbb"]
+    assert program.pack_pages([], max_chars=9) == []
+
+def test_pack_pages_splits_oversized_pages_on_their_own():
+    assert program.pack_pages(["aa", "x" * 12, "bb"], max_chars=5) == ["aa", "xxxxx", "xxxxx", "xx", "bb"]
+
+def test_pack_pages_keeps_fitting_pages_whole_and_in_order():
+    pages = [" ".join(f"p{i}w{j}" for j in range(i % 5 + 1)) for i in range(200)]
+    chunks = program.pack_pages(pages, max_chars=120)
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert "\n".join(chunks).split("\n") == pages
+
+def force_manual_csv_fallback(monkeypatch):
+    def reject(*args, **kwargs):
+        raise program.pd.errors.ParserError("malformed")
+    monkeypatch.setattr(program.pd, "read_csv", reject)
+
+def test_robust_read_csv_repairs_ragged_rows(monkeypatch):
+    force_manual_csv_fallback(monkeypatch)
+    df = program.robust_read_csv("a,b,c\n1,2\n3,4,5,6\n\n7,8,9")
+    assert list(df.columns) == ["a", "b", "c"]
+    # Short rows are padded with "", overflow is folded into the last column, blank lines are dropped
+    assert df.values.tolist() == [["1", "2", ""], ["3", "4", "5,6"], ["7", "8", "9"]]
+
+def test_robust_read_csv_repairs_ragged_rows_without_header(monkeypatch):
+    force_manual_csv_fallback(monkeypatch)
+    df = program.robust_read_csv("1,2\n3\n4,5,6", has_header=False)
+    assert list(df.columns) == ["col_0", "col_1"]
+    assert df.values.tolist() == [["1", "2"], ["3", ""], ["4", "5,6"]]
+
+def test_robust_read_csv_skips_sniffer_for_consistent_comma_rows(monkeypatch):
+    force_manual_csv_fallback(monkeypatch)
+    def no_sniffer():
+        raise AssertionError("Sniffer used for consistent comma-separated rows")
+    monkeypatch.setattr(program.csv, "Sniffer", no_sniffer)
+    df = program.robust_read_csv("a,b\n1,2\n3,4\n5,6\n7,8\n9")
+    assert df.values.tolist() == [["1", "2"], ["3", "4"], ["5", "6"], ["7", "8"], ["9", ""]]
+
+def test_robust_read_csv_sniffs_when_comma_widths_disagree(monkeypatch):
+    force_manual_csv_fallback(monkeypatch)
+    df = program.robust_read_csv('a;b;c\n1;2;"x,y"\n3;4;5\n6;7;"p,q"')
+    assert list(df.columns) == ["a", "b", "c"]
+    assert df.values.tolist() == [["1", "2", "x,y"], ["3", "4", "5"], ["6", "7", "p,q"]]
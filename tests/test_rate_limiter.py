@@ -0,0 +1,36 @@
+from services import rate_limiter
+from services.rate_limiter import TokenBucket, approx_tokens
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def monotonic(self):
+        return self.now
+    def sleep(self, seconds):
+        self.now += seconds
+
+def test_approx_tokens():
+    assert approx_tokens("") == 1
+    assert approx_tokens("a" * 400) == 100
+
+def test_token_bucket_paces_requests(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    bucket = TokenBucket(rpm=2, tpm=1000)
+    bucket.acquire(10)
+    bucket.acquire(10)
+    assert clock.now == 0.0
+    bucket.acquire(10)
+    assert abs(clock.now - 30.0) < 1e-6
+
+def test_token_bucket_paces_tokens(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    bucket = TokenBucket(rpm=100, tpm=600)
+    bucket.acquire(600)
+    bucket.acquire(60)
+    assert abs(clock.now - 6.0) < 1e-6
+    bucket.acquire(10_000)  # oversized requests wait for a full bucket, not forever
+    assert abs(clock.now - 66.0) < 1e-6
@@ -0,0 +1,59 @@
+import json
+
+from services import transformer
+from services.transformer import deep_merge, merge_json_fragments, parse_tables_from_csv
+from utils import io as csv_io
+
+def test_merge_json_fragments():
+    merged = merge_json_fragments(['{"a": 1}', 'not json', '{"b": 2}'])
+    assert json.loads(merged) == {"a": 1, "b": 2}
+    assert merge_json_fragments(['{"only": true}']) == '{"only": true}'
+    assert merge_json_fragments([]) == ""
+
+def test_merge_json_fragments_without_orjson(monkeypatch):
+    monkeypatch.setattr(transformer, "orjson", None)
+    merged = merge_json_fragments(['{"a": [1]}', 'not json', '{"a": [2]}'])
+    assert json.loads(merged) == {"a": [1, 2]}
+
+def test_merge_json_fragments_concatenates_entities():
+    frag1 = json.dumps({"entities": [{"id": "1", "type": "T", "name": "A"}], "meta": {"source": "p1"}})
+    frag2 = json.dumps({"entities": [{"id": "2", "type": "T", "name": "B"}], "meta": {"pages": 2}})
+    merged = json.loads(merge_json_fragments([frag1, frag2]))
+    assert [e["id"] for e in merged["entities"]] == ["1", "2"]
+    assert merged["meta"] == {"source": "p1", "pages": 2}
+
+def test_deep_merge_replaces_scalars():
+    dst = {"a": 1, "b": [1], "c": {"x": 1}}
+    assert deep_merge(dst, {"a": 2, "b": [2], "c": {"x": 3}}) is dst
+    assert dst == {"a": 2, "b": [1, 2], "c": {"x": 3}}
+
+def test_parse_tables_from_csv_reads_values_as_text():
+    text = (
+        "=== START OF TABLE: People ===\n"
+        "id,name,age\n"
+        "001,Alice,\n"
+        "002,Bob,42\n"
+        "=== END OF TABLE: People ===\n"
+    )
+    tables = parse_tables_from_csv(text)
+    assert list(tables) == ["People"]
+    df = tables["People"]
+    assert list(df.columns) == ["id", "name", "age"]
+    assert df["id"].tolist() == ["001", "002"]
+    assert df["age"].tolist() == ["", "42"]
+
+def test_parse_tables_from_csv_sniffs_only_on_fallback(monkeypatch):
+    sniffed = []
+    monkeypatch.setattr(transformer, "sniff_dialect", lambda sample: sniffed.append(sample))
+    parse_tables_from_csv("=== START OF TABLE: A ===\na,b\n1,2\n=== END OF TABLE: A ===")
+    assert sniffed == []
+    def reject(*args, **kwargs):
+        raise csv_io.pd.errors.ParserError("malformed")
+    monkeypatch.setattr(csv_io.pd, "read_csv", reject)
+    tables = parse_tables_from_csv(
+        "=== START OF TABLE: A ===\na,b\n1,2\n=== END OF TABLE: A ===\n"
+        "=== START OF TABLE: B ===\nc,d\n3,4\n=== END OF TABLE: B ==="
+    )
+    # Both tables fall back to manual parsing, which sniffs the response's first line once
+    assert sniffed == ["a,b"]
+    assert tables["B"].values.tolist() == [["3", "4"]]
@@ -6,29 +6,38 @@ __all__ = ["chunk_text"]
 def chunk_text(text: str, max_chars: int = 12000) -> list[str]:
     """
     Split a long text into chunks such that each chunk's length does not exceed max_chars.
-    Tries to split at newline or whitespace boundaries for cleaner chunks.
+    Lines are packed greedily so chunks end on line boundaries; a single line longer than
+    max_chars is split at whitespace where possible, otherwise at max_chars.
     """
+    stripped = text.strip()
+    if len(stripped) <= max_chars:
+        # Common case: the whole document fits in one chunk
+        return [stripped] if stripped else []
     chunks: list[str] = []
-    current_pos = 0
-    length = len(text)
-    while current_pos < length:
-        end_pos = current_pos + max_chars
-        if end_pos >= length:
-            chunk = text[current_pos:].strip()
-            if chunk:
-                chunks.append(chunk)
-            break
-        split_idx = text.rfind("\n", current_pos, end_pos)
-        if split_idx == -1 or split_idx < current_pos:
-            split_idx = text.rfind(" ", current_pos, end_pos)
-        if split_idx == -1 or split_idx < current_pos:
-            split_idx = end_pos - 1
-        if split_idx < current_pos:
-            split_idx = end_pos - 1
-            if split_idx < current_pos:
-                split_idx = length - 1
-        chunk = text[current_pos: split_idx + 1].strip()
+    buf: list[str] = []
+    size = 0
+
+    def flush() -> None:
+        chunk = "".join(buf).strip()
         if chunk:
             chunks.append(chunk)
-        current_pos = split_idx + 1
-    return [c for c in chunks if c]
\ No newline at end of file
+
+    for line in text.splitlines(keepends=True):
+        if size + len(line) <= max_chars:
+            buf.append(line)
+            size += len(line)
+            continue
+        flush()
+        buf, size = [], 0
+        while len(line) > max_chars:
+            split_idx = line.rfind(" ", 0, max_chars)
+            if split_idx == -1:
+                split_idx = max_chars - 1
+            chunk = line[:split_idx + 1].strip()
+            if chunk:
+                chunks.append(chunk)
+            line = line[split_idx + 1:]
+        buf.append(line)
+        size = len(line)
+    flush()
+    return chunks
@@ -3,36 +3,66 @@ Utility functions for input/output operations such as robust CSV parsing.
 """
 from io import StringIO
 import csv
+from collections.abc import Callable
 import pandas as pd
 import streamlit as st
 
-__all__ = ["robust_read_csv"]
+__all__ = ["robust_read_csv", "sniff_dialect"]
 
-def robust_read_csv(csv_text: str, has_header: bool = True) -> pd.DataFrame:
+def sniff_dialect(sample: str) -> type[csv.Dialect] | None:
+    """
+    Detect the CSV dialect of a sample line.
+    
+    :param sample: Text to sniff, typically a header row.
+    :return: The detected dialect, or None if it could not be determined.
+    """
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        return None
+
+def robust_read_csv(
+    csv_text: str,
+    has_header: bool = True,
+    dialect_provider: Callable[[], type[csv.Dialect] | None] | None = None
+) -> pd.DataFrame:
     """
     Read CSV text into a pandas DataFrame with extra error handling for malformed CSV content.
     
-    Tries pandas read_csv first, then falls back to a manual CSV parsing if needed.
+    Tries pandas' C parser first, then its Python parser, then falls back to a manual CSV parsing if needed.
+    All values are read as strings (empty cells stay ""), since LLM-generated CSV is passed
+    through as-is and type inference only costs time.
+    
+    :param csv_text: The CSV content.
+    :param has_header: Whether the first row holds the column names.
+    :param dialect_provider: Called for the dialect of the manual fallback only once the default
+                             comma parse has failed, e.g. to sniff one dialect for all tables of
+                             a response; the first line is sniffed when omitted.
+    :return: The parsed DataFrame (empty if nothing could be parsed).
     """
     csv_text_stripped = csv_text.strip()
     if not csv_text_stripped:
         return pd.DataFrame()
+    read_kwargs = {"header": 0 if has_header else None, "dtype": str, "keep_default_na": False, "on_bad_lines": 'skip'}
     try:
-        df = pd.read_csv(StringIO(csv_text_stripped), header=0 if has_header else None, on_bad_lines='skip', engine='python')
-        return df
+        try:
+            return pd.read_csv(StringIO(csv_text_stripped), engine='c', **read_kwargs)
+        except (pd.errors.ParserError, csv.Error):
+            # The Python engine tolerates some malformed input the C engine rejects
+            return pd.read_csv(StringIO(csv_text_stripped), engine='python', **read_kwargs)
     except pd.errors.EmptyDataError:
         return pd.DataFrame()
     except (pd.errors.ParserError, csv.Error) as err:
         st.warning(f"Pandas/CSV ParserError, attempting manual fallback: {err}. Content snippet: '{csv_text_stripped[:200]}'")
-        lines = csv_text_stripped.splitlines()
-        if not lines:
-            return pd.DataFrame()
         try:
-            try:
-                dialect = csv.Sniffer().sniff(lines[0] if lines else csv_text_stripped, delimiters=",;\t|")
-                reader = csv.reader(lines, dialect=dialect)
-            except csv.Error:
-                reader = csv.reader(lines)
+            if dialect_provider is not None:
+                dialect = dialect_provider()
+            else:
+                dialect = sniff_dialect(csv_text_stripped.partition("\n")[0])
+            # Read the text directly rather than materialising a list of lines first; newline=''
+            # also keeps line breaks inside quoted fields intact
+            source = StringIO(csv_text_stripped, newline='')
+            reader = csv.reader(source, dialect=dialect) if dialect is not None else csv.reader(source)
             all_rows = list(reader)
         except Exception as reader_err:
             st.warning(f"CSV reader failed during fallback: {reader_err}")
@@ -65,7 +95,7 @@ def robust_read_csv(csv_text: str, has_header: bool = True) -> pd.DataFrame:
                 fixed_rows.append(row + [""] * (col_count - len(row)))
         try:
             if fixed_rows:
-                return pd.DataFrame(fixed_rows, columns=header_row)
+                return pd.DataFrame.from_records(fixed_rows, columns=header_row)
             else:
                 return pd.DataFrame(columns=header_row) if header_row else pd.DataFrame()
         except Exception as final_err: